@@ -0,0 +1,110 @@
+"""benchmark the preparation and formatting of climate site data (cdgen)
+
+Builds a synthetic spatial block (years of daily data on a grid of sites,
+float32 like the source data) and times
+
+* extracting the sorted site rows: dataframe conversion, pandas groupby and
+  sort per site (reference) vs. cdgen.block_sites on the arrays
+* formatting the rows of all sites with np.savetxt (reference) and
+  format_fixed
+
+    python benchmarks/bench_climate_writer.py --sites 50 --years 30
+"""
+import argparse
+import io
+import time
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from ldndctools.cdgen import block_sites, DATA_COLUMNS, DATA_FORMAT
+from ldndctools.io.fixedwidth import format_fixed
+
+
+def synthetic_block(sites: int, years: int, seed: int = 0) -> xr.Dataset:
+    """daily data of a (1, sites) grid, site ids in random order"""
+    rng = np.random.default_rng(seed)
+    days = pd.date_range("1991-01-01", periods=years * 365, freq="D")
+    shape = (len(days), 1, sites)
+    ds = xr.Dataset(
+        {v: (("time", "lat", "lon"), rng.normal(10, 8, shape)) for v in DATA_COLUMNS},
+        coords={"time": days, "lat": [50.0], "lon": 8 + np.arange(sites) * 0.1},
+    ).astype(np.float32)
+    ds["geohash"] = (("lat", "lon"), rng.permutation(sites)[np.newaxis] + 1)
+    return ds
+
+
+def dataframe_blocks(ds: xr.Dataset):
+    df = ds.set_coords("geohash").stack(location=("lon", "lat")).to_dataframe()
+    df = df.reset_index().set_index("geohash")
+    blocks = []
+    for _, gdf in df.groupby(df.index):
+        gdf = gdf.sort_values(by="time")
+        blocks.append(
+            np.column_stack(
+                [gdf.time.dt.year, gdf.time.dt.dayofyear]
+                + [gdf[v] for v in DATA_COLUMNS]
+            )
+        )
+    return blocks
+
+
+def array_blocks(ds: xr.Dataset):
+    data = {k: ds[k].values for k in DATA_COLUMNS}
+    sites, _ = block_sites(
+        data, ds.time.values, ds.lat.values, ds.lon.values, ds.geohash.values
+    )
+    return [rows for _, rows in sites]
+
+
+def run_savetxt(blocks) -> str:
+    buffer = io.StringIO()
+    for block in blocks:
+        np.savetxt(buffer, block, fmt=DATA_FORMAT)
+    return buffer.getvalue()
+
+
+def run_format_fixed(blocks) -> str:
+    return "".join(format_fixed(block, DATA_FORMAT) for block in blocks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sites", type=int, default=50)
+    parser.add_argument("--years", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    ds = synthetic_block(args.sites, args.years)
+    rows = ds.time.size * args.sites
+    print(f"{args.sites} sites x {args.years} years ({rows} rows)")
+
+    def best_of(func, *func_args):
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = func(*func_args)
+            timings.append(time.perf_counter() - start)
+        return result, min(timings)
+
+    results = {}
+    for name, func, data in [
+        ("dataframe", dataframe_blocks, ds),
+        ("block_sites", array_blocks, ds),
+        ("savetxt", run_savetxt, None),
+        ("format_fixed", run_format_fixed, None),
+    ]:
+        data = results["block_sites"] if data is None else data
+        results[name], best = best_of(func, data)
+        print(f"{name:>14}: {best:.3f}s ({rows / best / 1e6:.2f} M rows/s)")
+
+    assert all(
+        np.array_equal(a, b)
+        for a, b in zip(results["dataframe"], results["block_sites"])
+    ), "site rows differ"
+    assert results["savetxt"] == results["format_fixed"], "output differs"
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,67 @@
 import argparse
-import gzip
-import io
+import datetime
+import json
+import os
 import platform
+import sys
 import warnings
 from dataclasses import dataclass
 from importlib import resources
 from pathlib import Path
-from typing import Any, Dict, Iterable, Optional, Union
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
 
 import dask
-import intake
 import numpy as np
 import pandas as pd
 import urllib3
 import xarray as xr
-from dask.distributed import LocalCluster, Client
 from pydantic import ValidationError
 
-from ldndctools.misc.geohash import coords2geohash_dec
+from ldndctools.extra import get_config_section
+from ldndctools.io.blockarchive import (
+    BlockArchiveWriter,
+    CODECS,
+    index_path,
+    Member,
+    read_member,
+)
+from ldndctools.io.fixedwidth import format_fixed
+from ldndctools.misc.errors import EmptySelectionError
+from ldndctools.misc.geohash import (
+    cells_bbox,
+    common_prefix,
+    coords2geohash_dec,
+    dec2cells,
+)
 from ldndctools.misc.types import BoundingBox
+from ldndctools.sources.climate.layout import is_time_major, to_time_major
+from ldndctools.sources.climate.stats import site_stats, STATS
 
 warnings.filterwarnings("ignore")
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# data columns (after year, jday) of the site files
+DATA_COLUMNS = ["tavg", "tmin", "tmax", "rad", "prec", "rh", "wind"]
+
+# positions of the columns of which one is required for a data row (day)
+REQUIRED = [DATA_COLUMNS.index(c) for c in DATA_COLUMNS if c != "prec"]
+
+# climate data used unless --source is given (catalog entry)
+DEFAULT_SOURCE = "climate_era5land_hr"
+
+# metadata files of a zarr store (v3, v2 group, v2 consolidated)
+ZARR_METADATA = ("zarr.json", ".zgroup", ".zmetadata")
+
+# memory of a writer task relative to its climate data (source, float64 copies,
+# formatted text, compressed output)
+BLOCK_MEMORY_FACTOR = 10
+
+# precision (characters) of the site geohashes
+GEOHASH_PRECISION = 6
+
+# year, jday, tavg, tmin, tmax, grad, prec, rh, wind
+DATA_FORMAT = "%-8.0f%-8.0f%-8.2f%-8.2f%-8.2f%-8.2f%-8.1f%-8.1f%-8.2f"
+
 
 @dataclass
 class ClimateSiteStats:
@@ -40,49 +79,192 @@ class ClimateSiteStats:
     rainfall_intensity: Optional[float] = 5.0
 
 
+def open_climate_source(source: Optional[str] = None) -> xr.Dataset:
+    """open climate data (lazy): zarr store, NetCDF file(s) or catalog entry
+
+    Paths and urls ending in .zarr and directories holding zarr metadata (zarr
+    v2 or v3, any name) are opened as zarr stores, other existing files, globs
+    and urls as NetCDF. Anything else is looked up in the ldndctools catalog
+    (default: DEFAULT_SOURCE).
+    """
+    source = str(source or DEFAULT_SOURCE)
+    path = Path(source)
+
+    is_store = any((path / name).is_file() for name in ZARR_METADATA)
+    if source.rstrip("/").endswith(".zarr") or is_store:
+        return xr.open_zarr(source)
+    if "*" in source:
+        return xr.open_mfdataset(source)
+    if path.is_file() or "://" in source:
+        return xr.open_dataset(source, chunks={})
+
+    import intake
+
+    with resources.path("data", "catalog.yml") as cat:
+        catalog = intake.open_catalog(str(cat))
+    if source not in catalog:
+        raise ValueError(f"Unknown climate source (no file or catalog entry): {source}")
+    return catalog[source].to_dask()
+
+
 def subset_climate_data(
     *,
+    source: Optional[str] = None,
     bbox: Optional[BoundingBox] = None,
     mask: Optional[xr.DataArray] = None,
+    mask_tolerance: Optional[float] = None,
     date_min: Optional[str] = None,
     date_max: Optional[str] = None,
 ) -> xr.Dataset:
+    """lazy climate data of the bbox, mask and date range
 
-    with resources.path("data", "catalog.yml") as cat:
-        catalog = intake.open_catalog(str(cat))
-        #load the data into a Dask Dataset
-        ds = catalog["climate_era5land_hr"].to_dask()
-        ds = xr.open_zarr(
-            store="s3://era5land-zarr/data.zarr",
-            consolidated=True,
-            storage_options={
-                "anon": True,
-                "client_kwargs": {
-                    "endpoint_url": "https://s3.imk-ifu.kit.edu:10443",
-                    "verify": False
-                },
-                "use_ssl": True,
-            },
-        )
-        if mask is not None:
-            #match the latitude and longitude coordinates of ds
-            mask = mask.interp(lat=ds["lat"], lon=ds["lon"])
-            ds = ds.where(mask>0)
+    The mask is mapped onto the climate grid by index (nearest mask cell within
+    mask_tolerance, see align_to_grid) and kept as coordinate mask.
+    """
+    ds = open_climate_source(source)
 
-        if bbox:
-            ds = ds.sel(lat=slice(bbox.y1, bbox.y2), lon=slice(bbox.x1, bbox.x2))
+    if bbox:
+        ds = ds.sel(lat=slice(bbox.y1, bbox.y2), lon=slice(bbox.x1, bbox.x2))
 
-        if date_min:
-            ds = ds.sel(time=slice(date_min, None))
+    if mask is not None:
+        # deferred: scipy (kd-tree lookups of the module) is slow to import
+        from ldndctools.misc.spatial import align_to_grid
+
+        mask = align_to_grid(mask, ds.lat, ds.lon, tolerance=mask_tolerance)
+        valid = (mask > 0).values
+        if not valid.any():
+            raise EmptySelectionError(
+                "No mask cell matches the climate grid (check the mask grid or "
+                "the mask tolerance)"
+            )
+        # crop to the masked-in extent, chunks without valid cells are not read
+        window = {
+            "lat": _extent(valid.any(axis=1)),
+            "lon": _extent(valid.any(axis=0)),
+        }
+        ds = skip_empty_chunks(ds.isel(window), valid[window["lat"], window["lon"]])
+        mask = mask.isel(window)
+        ds = ds.where(mask > 0).assign_coords(mask=mask)
+
+    if date_min:
+        ds = ds.sel(time=slice(date_min, None))
+
+    if date_max:
+        ds = ds.sel(time=slice(None, date_max))
 
-        if date_max:
-            ds = ds.sel(time=slice(None, date_max))
+    return ds
 
+
+def _extent(flags: np.ndarray) -> slice:
+    """smallest slice holding all set flags"""
+    index = np.flatnonzero(flags)
+    return slice(index[0], index[-1] + 1) if len(index) else slice(0, 0)
+
+
+def chunk_mask(valid: np.ndarray, chunks: Tuple[Tuple[int, ...], ...]) -> np.ndarray:
+    """(lat, lon) mask projected onto the chunk grid: chunks with a valid cell"""
+    ybounds, xbounds = (np.cumsum((0,) + c)[:-1] for c in chunks)
+    rows = np.logical_or.reduceat(valid, ybounds, axis=0)
+    return np.logical_or.reduceat(rows, xbounds, axis=1)
+
+
+def skip_empty_chunks(ds: xr.Dataset, valid: np.ndarray) -> xr.Dataset:
+    """replace the spatial chunks without valid (lat, lon) cells by nan
+
+    The chunks are replaced in the dask graph, so the source chunks are never
+    read (and blocks of them only are not written, see block_tasks).
+    """
+    if not ds.chunks or not valid.size:
+        return ds
+
+    # deferred: dask.array is slow to import (cli startup)
+    import dask.array as da
+
+    dims = ("lat", "lon")
+    used = chunk_mask(valid, (ds.chunks["lat"], ds.chunks["lon"]))
+    if used.all():
+        return ds
+
+    def masked(x):
+        ny, nx = x.chunks[-2:]
+        blocks = [
+            [
+                (
+                    x.blocks[..., j, i]
+                    if used[j, i]
+                    else da.full(
+                        x.shape[:-2] + (ny[j], nx[i]),
+                        np.nan,
+                        chunks=x.chunks[:-2] + ((ny[j],), (nx[i],)),
+                        dtype=x.dtype,
+                    )
+                )
+                for i in range(len(nx))
+            ]
+            for j in range(len(ny))
+        ]
+        return da.block(blocks)
+
+    for name, var in ds.data_vars.items():
+        if set(dims) <= set(var.dims) and var.chunks is not None:
+            var = var.transpose(..., *dims)
+            ds[name] = var.copy(data=masked(var.data))
     return ds
 
 
-def amplitude(da):
-    return (da.max(dim="time") - da.min(dim="time")) / 2
+def mirror(ds: xr.Dataset, store: Union[str, Path]) -> None:
+    """copy (a subset of) climate data into a local zarr store"""
+    # zarr needs regular chunks, subsets usually start within a source chunk
+    ds = ds.chunk({dim: max(chunks) for dim, chunks in ds.chunks.items()})
+    for var in ds.variables.values():
+        var.encoding.pop("chunks", None)
+        var.encoding.pop("preferred_chunks", None)
+    ds.to_zarr(store, mode="w", consolidated=True)
+
+
+@dataclass
+class SiteStatsTable:
+    """columnar site statistics, sorted by geohash
+
+    Behaves like a read-only mapping geohash -> ClimateSiteStats, the
+    dataclass is only created on access.
+    """
+
+    geohash: np.ndarray
+    lat: np.ndarray
+    lon: np.ndarray
+    wind: np.ndarray
+    prec: np.ndarray
+    tavg: np.ndarray
+    tamp: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.geohash)
+
+    def _position(self, geohash: int) -> int:
+        n = int(np.searchsorted(self.geohash, geohash))
+        if n == len(self.geohash) or self.geohash[n] != geohash:
+            raise KeyError(geohash)
+        return n
+
+    def __contains__(self, geohash: int) -> bool:
+        try:
+            self._position(geohash)
+        except KeyError:
+            return False
+        return True
+
+    def __getitem__(self, geohash: int) -> ClimateSiteStats:
+        n = self._position(geohash)
+        return ClimateSiteStats(
+            id=int(self.geohash[n]),
+            latitude=float(self.lat[n]),
+            longitude=float(self.lon[n]),
+            wind_speed=float(self.wind[n]),
+            annual_precipitation=float(self.prec[n]),
+            temperature_average=float(self.tavg[n]),
+            temperature_amplitude=float(self.tamp[n]),
+        )
 
 
 def fill_header_global(time: pd.Timestamp) -> str:
@@ -122,50 +304,160 @@ temperature amplitude = {d.temperature_amplitude:.2f}
     return txt
 
 
-def writer(
-    df: pd.DataFrame, pid: int, *, lookup: Dict[int, ClimateSiteStats], args: Any = None
-) -> Iterable[int]:
-
-    buffer = io.StringIO()
-
-    header_global = fill_header_global(df.time.min().date())
-    buffer.write(header_global)
-
-    all_hashes: Iterable[int] = []
-    for geohash, gdf in df.groupby(df.index):
-        geohash = int(geohash)
-        data = lookup[geohash]
-        header = fill_header(data)
-        buffer.write(header)
-
-        gdf = gdf.sort_values(by="time")
-        cols = ["year", "jday", "tavg", "tmin", "tmax", "grad", "prec", "rh", "wind"]
-        values = [
-            gdf.time.dt.year,
-            gdf.time.dt.dayofyear,
-            gdf.tavg,
-            gdf.tmin,
-            gdf.tmax,
-            gdf.rad,
-            gdf.prec,
-            gdf.rh,
-            gdf.wind,
-        ]
+@dataclass
+class SiteData:
+    """data rows (year, jday, DATA_COLUMNS) of sites, sorted by (geohash, time)
+
+    The rows of site n are the zero-copy slice rows[starts[n]:ends[n]].
+    """
+
+    rows: np.ndarray
+    ids: np.ndarray
+    starts: np.ndarray
+    ends: np.ndarray
+    first_date: Optional[datetime.date] = None
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray]]:
+        for site, start, end in zip(self.ids, self.starts, self.ends):
+            yield int(site), self.rows[start:end]
+
+
+def block_sites(
+    data: Mapping[str, np.ndarray],
+    time: np.ndarray,
+    lat: np.ndarray,
+    lon: np.ndarray,
+    geohash: np.ndarray,
+) -> Tuple[SiteData, SiteStatsTable]:
+    """data rows and statistics of the sites of a spatial block
+
+    data holds (time, lat, lon) arrays of DATA_COLUMNS, geohash the (lat, lon)
+    site ids (<= 0: no site). Days without data (prec is ignored) are dropped at
+    the array level, cells without any data are no sites.
+    """
+    cells = np.flatnonzero(geohash.ravel() > 0)
+    cells = cells[np.argsort(geohash.ravel()[cells], kind="stable")]
+
+    # (variable, cell, time): rows of a site are contiguous
+    ntime = len(time)
+    values = np.stack(
+        [np.asarray(data[c]).reshape(ntime, -1)[:, cells].T for c in DATA_COLUMNS]
+    )
+    present = ~np.isnan(values[REQUIRED]).all(axis=0)
+    counts = present.sum(axis=1)
+    found = counts > 0
+
+    days = pd.DatetimeIndex(time)
+    step = np.broadcast_to(np.arange(ntime), present.shape)[present]
+    rows = np.empty((2 + len(DATA_COLUMNS), len(step)))
+    rows[0], rows[1] = days.year[step], days.dayofyear[step]
+    rows[2:] = values[:, present]
+
+    ends = np.cumsum(counts)[found]
+    sites = SiteData(
+        rows=rows.T,
+        ids=geohash.ravel()[cells[found]],
+        starts=ends - counts[found],
+        ends=ends,
+        first_date=days[step.min()].date() if len(step) else None,
+    )
 
-        fmt = "%-8.0f%-8.0f%-8.2f%-8.2f%-8.2f%-8.2f%-8.1f%-8.1f%-8.2f"
-        np.savetxt(buffer, pd.DataFrame(dict(zip(cols, values))), fmt=fmt)
+    column = {c: n for n, c in enumerate(DATA_COLUMNS)}
+    tavg, prec, wind = (values[column[c], found] for c in ["tavg", "prec", "wind"])
+    stats = site_stats(tavg, prec, wind, days.year.values)
+    j, i = np.divmod(cells[found], len(lon))
+    table = SiteStatsTable(
+        geohash=sites.ids,
+        lat=np.asarray(lat)[j],
+        lon=np.asarray(lon)[i],
+        **{k: stats[n] for n, k in enumerate(STATS)},
+    )
+    return sites, table
 
-        all_hashes.append(geohash)
 
-        buffer.write("\n\n")
-    buffer.seek(0)
+def archive_name(pid: int, codec: str = "gzip") -> str:
+    return f"climdata-{pid:03}.txt{CODECS[codec].suffix}"
 
-    with gzip.open(args.outfolder / f"climdata-{pid:03}.txt.gz", "wt") as f:
-        f.write(buffer.read())
+
+def writer(
+    sites: SiteData,
+    pid: int,
+    *,
+    lookup: Mapping[int, ClimateSiteStats],
+    args: Any = None,
+) -> List[int]:
+    """write the sites into an archive of one member per site (indexed)
+
+    Sites are formatted one by one and compressed in parallel (streaming, the
+    text of the partition is never held in memory as a whole).
+    """
+    all_hashes: List[int] = []
+    with BlockArchiveWriter(
+        args.outfolder / archive_name(pid, args.compression),
+        codec=args.compression,
+        level=args.level,
+        threads=args.compress_threads,
+    ) as archive:
+        if sites.first_date is not None:
+            archive.add(fill_header_global(sites.first_date).encode())
+
+        for site, rows in sites:
+            text = fill_header(lookup[site]) + format_fixed(rows, DATA_FORMAT) + "\n\n"
+            archive.add(text.encode(), key=str(site))
+            all_hashes.append(site)
 
     return all_hashes
 
 
+def read_site(index: Mapping[str, Member], geohash: int) -> str:
+    """climate block (header and data) of one site, index: open_index(outfolder)"""
+    return read_member(index[str(geohash)]).decode()
+
+
+def write_block(
+    chunks: Mapping[str, List[np.ndarray]],
+    pid: int,
+    *,
+    time: np.ndarray,
+    lat: np.ndarray,
+    lon: np.ndarray,
+    geohash: np.ndarray,
+    args: Any = None,
+) -> List[int]:
+    """write the sites of one spatial block (time chunks of each variable)"""
+    data = {k: np.concatenate(v, axis=0) for k, v in chunks.items()}
+    sites, stats = block_sites(data, time, lat, lon, geohash)
+    return writer(sites, pid, lookup=stats, args=args)
+
+
+def block_tasks(ds: xr.Dataset, geohash: np.ndarray, args: Any) -> List[Any]:
+    """one writer task per spatial chunk of ds with sites (no dataframe, no shuffle)"""
+    ds = ds[DATA_COLUMNS].transpose("time", "lat", "lon").unify_chunks()
+    # unoptimized: tasks only depend on the source chunks of their block
+    chunks = {k: ds[k].data.to_delayed(optimize_graph=False) for k in DATA_COLUMNS}
+    ybounds = np.cumsum((0,) + ds.chunks["lat"])
+    xbounds = np.cumsum((0,) + ds.chunks["lon"])
+
+    time = ds.time.values
+    tasks = []
+    for bj, (y0, y1) in enumerate(zip(ybounds[:-1], ybounds[1:])):
+        for bi, (x0, x1) in enumerate(zip(xbounds[:-1], xbounds[1:])):
+            if not (geohash[y0:y1, x0:x1] > 0).any():
+                continue  # no site (masked out), the block is never read
+            tasks.append(
+                dask.delayed(write_block)(
+                    {k: v[:, bj, bi].tolist() for k, v in chunks.items()},
+                    len(tasks),
+                    time=time,
+                    lat=ds.lat.values[y0:y1],
+                    lon=ds.lon.values[x0:x1],
+                    geohash=geohash[y0:y1, x0:x1],
+                    args=args,
+                )
+            )
+    return tasks
+
+
 @np.vectorize
 def inner_func(x, lat, lon):
     return -1 if np.isnan(x) else coords2geohash_dec(lat=lat, lon=lon)
@@ -174,7 +466,9 @@ def inner_func(x, lat, lon):
 def geohash_xr(mask: xr.DataArray) -> xr.DataArray:
     lon_xr = mask.lon.broadcast_like(mask)
     lat_xr = mask.lat.broadcast_like(mask)
-    data = xr.apply_ufunc(inner_func, mask, lat_xr, lon_xr, output_dtypes=[np.int64], dask="allowed")
+    data = xr.apply_ufunc(
+        inner_func, mask, lat_xr, lon_xr, output_dtypes=[np.int64], dask="allowed"
+    )
     assert data.dtype == np.int64
     return data
 
@@ -203,14 +497,217 @@ def get_mask(mask_flag: str) -> xr.DataArray:
     return xr.ones_like(da).where(da > 0)
 
 
-def conf():
-    parser = argparse.ArgumentParser()
+def start_client(args: Any) -> Any:
+    """dask client of a running scheduler or a new local cluster"""
+    # dask.distributed is slow to import, only needed once args are valid
+    from dask.distributed import Client, LocalCluster
+
+    if args.scheduler:
+        return Client(args.scheduler)
+
+    cores = os.cpu_count() or 1
+    if args.threads:
+        # one process, formatting threads compete for the GIL
+        cluster = LocalCluster(
+            n_workers=1,
+            threads_per_worker=args.workers or cores,
+            processes=False,
+            memory_limit=args.memory_limit,
+            dashboard_address=args.dashboard,
+        )
+    else:
+        cluster = LocalCluster(
+            n_workers=args.workers or cores,
+            threads_per_worker=1,
+            memory_limit=args.memory_limit,
+            dashboard_address=args.dashboard,
+        )
+
+    port = args.dashboard.rsplit(":", 1)[-1]
+    node = platform.node()
+    print(f"NOTE: You can see progress at {node}:{port} if bokeh is installed")
+    return Client(cluster)
+
+
+def task_memory(client: Any) -> Optional[int]:
+    """memory (bytes) available to one task on the smallest worker"""
+    workers = client.scheduler_info().get("workers", {}).values()
+    limits = [w["memory_limit"] // w["nthreads"] for w in workers if w["memory_limit"]]
+    return min(limits) if limits else None
+
+
+def available_cores() -> int:
+    """cores this process may run on (cpu affinity, e.g. of a batch job)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def compress_threads(client: Any) -> int:
+    """compression threads per writer task that use otherwise idle cores
+
+    The cores of each host (as seen by its workers, a remote cluster may differ
+    from the machine running cdgen) are shared by all worker threads on that
+    host, the smallest share of all hosts is used.
+    """
+    workers = client.scheduler_info().get("workers", {})
+    if not workers:
+        return 1
+    cores = client.run(available_cores)
+
+    hosts: Dict[str, List[int]] = {}
+    for address, worker in workers.items():
+        if address in cores:
+            host = hosts.setdefault(worker.get("host", address), [0, 0])
+            host[0] = max(host[0], cores[address])
+            host[1] += worker["nthreads"]
+    shares = [c // n for c, n in hosts.values() if n]
+    return max(min(shares, default=1), 1)
+
+
+def site_bytes(ds: xr.Dataset) -> int:
+    """bytes of the (source) climate time series of one site"""
+    return ds.sizes["time"] * sum(ds[c].dtype.itemsize for c in DATA_COLUMNS)
+
+
+def partition_bytes(ds: xr.Dataset, args: Any, memory: Optional[int] = None) -> int:
+    """target climate data bytes of a partition (writer task)
+
+    Either the data split into --partitions parts or --partition-size, capped
+    so that a writer task (about BLOCK_MEMORY_FACTOR times the data) fits the
+    memory available per task.
+    """
+    if args.npart:
+        target = ds.sizes["lat"] * ds.sizes["lon"] * site_bytes(ds) // args.npart
+    else:
+        target = dask.utils.parse_bytes(args.partition_size)
+    if memory:
+        target = min(target, memory // BLOCK_MEMORY_FACTOR)
+    return max(int(target), 1)
+
+
+def block_shape(ds: xr.Dataset, target: int) -> Tuple[int, int]:
+    """spatial block (lat, lon) holding about target bytes of site time series
+
+    Blocks are multiples of the (largest) source chunk, or a part of it if one
+    chunk exceeds the target, so source chunks are rarely split across blocks.
+    """
+    ny, nx = ds.sizes["lat"], ds.sizes["lon"]
+    sites = max(target // site_bytes(ds), 1)
+    if ds.chunks:
+        cy, cx = max(ds.chunks["lat"]), max(ds.chunks["lon"])
+    else:
+        cy, cx = ny, nx
+
+    if cy * cx <= sites:
+        fy = fx = max(int(np.sqrt(sites / (cy * cx))), 1)
+        while fy * (fx + 1) * cy * cx <= sites and fx * cx < nx:
+            fx += 1
+        return min(fy * cy, ny), min(fx * cx, nx)
+
+    by = min(max(int(np.sqrt(sites)), 1), cy)
+    return by, min(max(sites // by, 1), cx)
+
+
+def merge_chunks(chunks: Sequence[int], size: int) -> Tuple[int, ...]:
+    """blocks of about size built from whole source chunks (split if larger)
+
+    Unlike a regular rechunk, block boundaries stay on source chunk boundaries
+    (a subset usually starts within a source chunk), so no source chunk (tile
+    of a time-major store) is read by two blocks.
+    """
+    blocks: List[int] = []
+    current = 0
+    for chunk in chunks:
+        if current and current + chunk > size:
+            blocks.append(current)
+            current = 0
+        while chunk > size:
+            blocks.append(size)
+            chunk -= size
+        current += chunk
+    return tuple(blocks + [current] * bool(current))
+
+
+def _runs(values: np.ndarray) -> Tuple[int, ...]:
+    """lengths of the runs of equal values"""
+    bounds = np.flatnonzero(np.diff(values)) + 1
+    return tuple(np.diff(np.concatenate([[0], bounds, [len(values)]])).tolist())
+
+
+def prefix_chunks(geohash: np.ndarray, pre: int) -> Tuple[Tuple[int, ...], ...]:
+    """(lat, lon) chunks with one block per geohash prefix (of pre characters)
+
+    Geohash cells are lat/lon rectangles, so the grid cells of a prefix form a
+    block of rows and columns. Rows and columns without sites join a neighbour.
+    """
+    sites = geohash > 0
+    shift = 5 * (GEOHASH_PRECISION - pre)
+    lat, lon = dec2cells(np.where(sites, geohash, 0) >> shift, pre)
+
+    chunks = []
+    for axis, cells in ((1, lat), (0, lon)):
+        index = np.where(sites, cells, -1).max(axis=axis)
+        found = np.flatnonzero(index >= 0)
+        if len(found):
+            # rows/ columns without sites take the cell before (or the first)
+            last = np.where(index >= 0, np.arange(len(index)), found[0])
+            index = index[np.maximum.accumulate(last)]
+        chunks.append(_runs(index))
+    return tuple(chunks)
+
+
+def snap_chunks(chunks: Sequence[int], source: Sequence[int]) -> Tuple[int, ...]:
+    """chunks with their boundaries moved to the nearest source chunk boundary
+
+    Source chunks larger than the largest chunk are split (boundaries within
+    them are kept), all others are read by one block only.
+    """
+    bounds = np.concatenate([[0], np.cumsum(source)])
+    edges = np.cumsum(chunks)[:-1]
+    k = np.searchsorted(bounds, edges, side="right")
+    lo, hi = bounds[k - 1], bounds[np.minimum(k, len(bounds) - 1)]
+    nearest = np.where(edges - lo <= hi - edges, lo, hi)
+    edges = np.unique(np.where(hi - lo <= max(chunks), nearest, edges))
+    edges = edges[(edges > 0) & (edges < bounds[-1])]
+    return tuple(np.diff(np.concatenate([[0], edges, bounds[-1:]])).tolist())
+
+
+def prefix_length(geohash: np.ndarray, sites: int) -> int:
+    """shortest geohash prefix with blocks of at most sites grid cells"""
+    for pre in range(1, GEOHASH_PRECISION):
+        ychunks, xchunks = prefix_chunks(geohash, pre)
+        if max(ychunks) * max(xchunks) <= sites:
+            return pre
+    return GEOHASH_PRECISION
+
+
+def manifest(ids: Sequence[List[int]], codec: str = "gzip") -> dict:
+    """archives with the geohash prefix common to all sites, bbox and sites
+
+    The bbox is the extent of the geohash cells of the sites (a partition of
+    whole source chunks may span several prefixes, down to the empty one).
+    """
+    partitions = []
+    for pid, sites in enumerate(ids):
+        name = archive_name(pid, codec)
+        entry = {"file": name, "index": index_path(name).name, "sites": len(sites)}
+        if sites:
+            prefix = common_prefix(min(sites), max(sites), GEOHASH_PRECISION)
+            bbox = cells_bbox(np.asarray(sites), GEOHASH_PRECISION)
+            entry.update(prefix=prefix, bbox=list(bbox))
+        partitions.append(entry)
+    return {"geohash_precision": GEOHASH_PRECISION, "partitions": partitions}
+
+
+def _add_subset_arguments(parser: argparse.ArgumentParser) -> None:
     parser.add_argument(
-        "outfolder",
-        nargs="?",
-        type=lambda p: Path(p).absolute(),
-        default=Path.cwd() / "output",
-        help="outpath for climate archive files",
+        "-s",
+        "--source",
+        dest="source",
+        default=None,
+        help="climate data: zarr store, NetCDF file(s) or catalog entry "
+        f"(default: {DEFAULT_SOURCE})",
     )
 
     parser.add_argument(
@@ -222,14 +719,6 @@ def conf():
         help="bounding box",
     )
 
-    parser.add_argument(
-        "-m",
-        "--mask",
-        dest="mask",
-        default=None,
-        help="netcdf file with mask variable [format: filename.nc:var]",
-    )
-
     parser.add_argument(
         "--dmin",
         dest="date_min",
@@ -246,136 +735,294 @@ def conf():
         help="maximum date to consider [format: 2001-12-31]",
     )
 
+
+def conf(argv: Optional[Sequence[str]] = None):
+    config_parser = argparse.ArgumentParser(add_help=False)
+    config_parser.add_argument(
+        "-c",
+        "--config",
+        dest="config",
+        default=None,
+        metavar="MYCONF",
+        help="use MYCONF file as config",
+    )
+    parser = argparse.ArgumentParser(parents=[config_parser])
+    parser.add_argument(
+        "outfolder",
+        nargs="?",
+        type=lambda p: Path(p).absolute(),
+        default=Path.cwd() / "output",
+        help="outpath for climate archive files",
+    )
+
+    _add_subset_arguments(parser)
+
+    parser.add_argument(
+        "-m",
+        "--mask",
+        dest="mask",
+        default=None,
+        help="netcdf file with mask variable [format: filename.nc:var]",
+    )
+
+    parser.add_argument(
+        "--mask-tolerance",
+        dest="mask_tolerance",
+        default=None,
+        type=float,
+        metavar="DEG",
+        help="max distance of matching mask and climate cells (default: half the "
+        "mask cell size)",
+    )
+
     parser.add_argument(
         "-p",
         "--partitions",
         dest="npart",
-        default=20,
+        default=None,
         type=int,
-        help="subdivision for output",
+        help="number of output partitions (default: derived from --partition-size)",
     )
 
-    args = parser.parse_args()
-    args.outfolder.mkdir(parents=True, exist_ok=True)
+    parser.add_argument(
+        "--partition-size",
+        dest="partition_size",
+        default="256MB",
+        help="target size of the climate data of one output partition",
+    )
 
-    return args
+    parser.add_argument(
+        "--partitioning",
+        dest="partitioning",
+        default="geohash",
+        choices=["geohash", "chunks"],
+        help="partitions of one geohash prefix (compact tiles, see manifest.json) "
+        "or of whole source chunks (each chunk read once, always used for "
+        "time-major sources)",
+    )
 
+    parser.add_argument(
+        "--prefix-length",
+        dest="prefix_length",
+        default=None,
+        type=int,
+        choices=range(1, GEOHASH_PRECISION + 1),
+        metavar="N",
+        help="geohash prefix length of the partitions (default: shortest prefix "
+        "within the partition size)",
+    )
 
-def main():
+    output_group = parser.add_argument_group("archive compression")
+    output_group.add_argument(
+        "--compression",
+        dest="compression",
+        default="gzip",
+        choices=list(CODECS),
+        help="codec of the archive members (zstd requires the zstandard package "
+        "and a LandscapeDNDC build that reads zstd)",
+    )
+    output_group.add_argument(
+        "--level",
+        dest="level",
+        default=None,
+        type=int,
+        help="compression level (default: gzip 6, zstd 3)",
+    )
+    output_group.add_argument(
+        "--compress-threads",
+        dest="compress_threads",
+        default=None,
+        type=int,
+        help="compression threads per writer task (default: cores of a worker "
+        "host not used by the dask worker threads on it)",
+    )
+
+    dask_group = parser.add_argument_group("dask execution")
+    dask_group.add_argument(
+        "--scheduler",
+        dest="scheduler",
+        default=None,
+        metavar="ADDRESS",
+        help="address of a running dask scheduler (default: start a local cluster)",
+    )
+    dask_group.add_argument(
+        "-w",
+        "--workers",
+        dest="workers",
+        default=None,
+        type=int,
+        help="number of local workers (default: number of cores)",
+    )
+    dask_group.add_argument(
+        "--threads",
+        dest="threads",
+        action="store_true",
+        help="use threads of one process instead of worker processes (formatting "
+        "holds the GIL, processes are usually faster)",
+    )
+    dask_group.add_argument(
+        "--memory-limit",
+        dest="memory_limit",
+        default="auto",
+        help="memory limit per local worker [format: 4GB]",
+    )
+    dask_group.add_argument(
+        "--dashboard",
+        dest="dashboard",
+        default=":1234",
+        metavar="ADDRESS",
+        help="dashboard address of the local cluster",
+    )
 
-    # Create a LocalCluster with 2 workers and set the dashboard address
-    cluster = LocalCluster(n_workers=2, memory_limit="2GB", dashboard_address=":1234")
+    # config file (section cdgen) provides the defaults, flags take precedence
+    config, _ = config_parser.parse_known_args(argv)
+    parser.set_defaults(**get_config_section("cdgen", config.config))
 
-    # Connect a Client to the LocalCluster
-    client = Client(cluster)
+    args = parser.parse_args(argv)
+    args.outfolder.mkdir(parents=True, exist_ok=True)
 
-    #client = Client(dashboard_address=":1234")
+    return args
 
-    print(f"NOTE: You can see progress at {platform.node()}:1234 if bokeh is installed")
 
-    args = conf()
+def conf_mirror(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(
+        prog="cdgen mirror",
+        description="copy a bbox and date subset of the climate data into a local "
+        "zarr store (use it with cdgen --source)",
+    )
+    parser.add_argument(
+        "store",
+        type=lambda p: Path(p).absolute(),
+        help="local zarr store (replaced if it exists)",
+    )
+    _add_subset_arguments(parser)
 
-    bbox = get_boundingbox(args.bbox)
-    mask = get_mask(args.mask)
+    parser.add_argument(
+        "--time-major",
+        dest="time_major",
+        action="store_true",
+        help="rechunk to long time series of small spatial tiles (fast site "
+        "extraction, detected by cdgen)",
+    )
+    parser.add_argument(
+        "--tile",
+        dest="tile",
+        default=10,
+        type=int,
+        help="cells per side of the spatial tiles of a time-major store",
+    )
+    parser.add_argument(
+        "--max-mem",
+        dest="max_mem",
+        default="1GB",
+        help="memory of one copy task of the time-major rechunk",
+    )
+    return parser.parse_args(argv)
+
+
+def main_mirror(argv: Optional[Sequence[str]] = None):
+    args = conf_mirror(argv)
 
-    print("subset climate")
-    # mask = xr.open_dataset("VN_MISC5_V2.nc")["rice_rot"]
-    # mask = xr.where(mask > 0, 1, np.nan)
     ds = subset_climate_data(
-        bbox=bbox,  # BoundingBox(x1=101.5, x2=109.5, y1=8.0, y2=23.5),
-        mask=mask,
-        # bbox=BoundingBox(x1=104.5, x2=105.5, y1=9.0, y2=10.0),
+        source=args.source,
+        bbox=get_boundingbox(args.bbox),
         date_min=args.date_min,
         date_max=args.date_max,
     )
+    print(f"mirror {dict(ds.sizes)} ({ds.nbytes / 1e9:.2f} GB) to {args.store}")
+    if args.time_major:
+        max_mem = dask.utils.parse_bytes(args.max_mem)
+        shapes = to_time_major(ds, args.store, tile=args.tile, max_mem=max_mem)
+        print(f"time-major chunks {shapes['chunks']} (copy regions {shapes['copy']})")
+    else:
+        mirror(ds, args.store)
 
-    print("group")
-    tavg_year = ds.tavg.groupby("time.year").mean(dim="time").mean(dim="year")
-    tamp_year = ds.tavg.groupby("time.year").apply(amplitude).mean(dim="year")
-    prec_year = ds.prec.groupby("time.year").sum(dim="time").mean(dim="year")
-    wind_year = ds.wind.groupby("time.year").mean(dim="time").mean(dim="year")
-
-    stats = xr.Dataset()
-    stats["tavg"] = tavg_year
-    stats["tamp"] = tamp_year
-    stats["prec"] = prec_year
-    stats["wind"] = wind_year
 
-    if mask is not None:
-        stats["mask"] = mask
-        ## check that coords are close, then use those of reference file
-        #coords_close = (
-        #    np.allclose(mask.lat.values, stats.lat.values, atol=1e-05) *
-        #    np.allclose(mask.lon.values, stats.lon.values, atol=1e-05)
-        #    )
-        #if coords_close:
-        #    stats = stats.assign_coords({"lat": mask.lat, "lon": mask.lon})
-        #else:
-        #    raise ValueError("Coords from climate and ref datasets are not close enough.")
-        
-        #stats["mask"] = xr.ones_like(stats.tavg.load())
-        #stats["mask"][:] = mask.values
-        ##stats["mask"] = mask.reindex_like(stats.tavg, method="nearest", tolerance=1e-3)
-    else:
-        stats["mask"] = xr.ones_like(stats.tavg).where(stats.tavg > -100)
+def main():
+    if sys.argv[1:2] == ["mirror"]:
+        return main_mirror(sys.argv[2:])
 
-    stats = stats.where(stats.mask == 1)
-    stats["geohash"] = geohash_xr(stats.mask)
-    stats["geohash"].attrs["_FillValue"] = -1
-    stats["geohash"].attrs["missing_value"] = -1
+    args = conf()
 
-    del stats["mask"]
+    client = start_client(args)
+    if args.compress_threads is None:
+        args.compress_threads = compress_threads(client)
 
-    # match coords (usually means take lat/ lon from ref dataset)
-    ds = ds.assign_coords({"lat": stats.lat, "lon": stats.lon})
+    bbox = get_boundingbox(args.bbox)
+    mask = get_mask(args.mask)
 
-    print("df stats")
-    df_stats = (
-        stats.to_dataframe()
-        .dropna(subset=["tavg", "tamp", "wind"], how="all")
-        .reset_index()
-    )
-    # ignore prec for now
-
-    print("lookup")
-    lookup: Dict[int, ClimateSiteStats] = {}
-    for _, row in df_stats.iterrows():
-        lookup[int(row["geohash"])] = ClimateSiteStats(
-            id=int(row["geohash"]),
-            latitude=row["lat"],
-            longitude=row["lon"],
-            wind_speed=row["wind"],
-            annual_precipitation=row["prec"],
-            temperature_average=row["tavg"],
-            temperature_amplitude=row["tamp"],
+    print("subset climate")
+    # mask = xr.open_dataset("VN_MISC5_V2.nc")["rice_rot"]
+    # mask = xr.where(mask > 0, 1, np.nan)
+    try:
+        ds = subset_climate_data(
+            source=args.source,
+            bbox=bbox,  # BoundingBox(x1=101.5, x2=109.5, y1=8.0, y2=23.5),
+            mask=mask,
+            mask_tolerance=args.mask_tolerance,
+            # bbox=BoundingBox(x1=104.5, x2=105.5, y1=9.0, y2=10.0),
+            date_min=args.date_min,
+            date_max=args.date_max,
         )
+    except EmptySelectionError as err:
+        print(f"No climate cells within the bounding box and mask. {err}")
+        exit(1)
 
-    ds["geohash"] = stats["geohash"]
-    ds = ds.stack(location=("lon", "lat"))
-    ds = ds.swap_dims({"location": "geohash"})
-    ds = ds.set_coords("geohash")
-    del ds["location"]
-
-    ddf = ds.to_dask_dataframe(dim_order=["geohash", "time"])
-    ddf = ddf.loc[ddf.geohash > 0, :]
-    ddf = ddf.set_index("geohash")
-    ddf = ddf.repartition(npartitions=args.npart)
+    if not ds.sizes["lat"] or not ds.sizes["lon"]:
+        print("No climate cells within the bounding box and mask.")
+        exit(1)
 
-    # ignore precip for now???
-    ddf = ddf.dropna(subset=["tavg", "tmin", "tmax", "rad", "rh", "wind"], how="all")
-    partitions = ddf.to_delayed(optimize_graph=True)
+    # site ids on the climate grid (in memory, the grid is 2d only)
+    grid = xr.Dataset(coords={"lat": ds.lat, "lon": ds.lon})
+    if mask is not None:
+        # aligned to the climate grid by subset_climate_data
+        grid["mask"] = ds["mask"]
+    else:
+        # all cells, cells without data are dropped with the empty data rows
+        grid["mask"] = xr.ones_like(grid.lat * grid.lon)
+
+    geohash = geohash_xr(grid.mask.where(grid.mask == 1))
+    geohash = geohash.transpose("lat", "lon").values
+
+    partitioning = args.partitioning
+    if is_time_major(ds):
+        if partitioning == "geohash":
+            # blocks of whole tiles, so each tile of the store is read once
+            print("time-major source: partitions of whole tiles (chunks)")
+            partitioning = "chunks"
+    else:
+        print(
+            "NOTE: source is chunked for maps, `cdgen mirror --time-major` speeds "
+            "up repeated runs"
+        )
 
-    formatted = [
-        dask.delayed(writer)(
-            part, i, lookup=dask.delayed(lookup), args=dask.delayed(args)
+    # one task per spatial block: stats and data rows are computed in-block
+    target = partition_bytes(ds, args, task_memory(client))
+    if partitioning == "geohash":
+        pre = args.prefix_length or prefix_length(
+            geohash, max(target // site_bytes(ds), 1)
         )
-        for i, part in enumerate(partitions)
-    ]
+        print(f"partitions of geohash prefix length {pre}")
+        chunks = dict(zip(("lat", "lon"), prefix_chunks(geohash, pre)))
+        if ds.chunks:
+            # on source chunk boundaries, so blocks do not share source chunks
+            chunks = {d: snap_chunks(c, ds.chunks[d]) for d, c in chunks.items()}
+        ds = ds.chunk(chunks)
+    else:
+        chunks = dict(zip(("lat", "lon"), block_shape(ds, target)))
+        if ds.chunks:
+            chunks = {d: merge_chunks(ds.chunks[d], n) for d, n in chunks.items()}
+        ds = ds.chunk(chunks)
+    formatted = block_tasks(ds, geohash, args)
+    print(f"{len(formatted)} partitions")
 
     processed_geohashs = dask.compute(*formatted)
     with open(args.outfolder / "ids.txt", "w") as out:
         for chunk_geohashs in processed_geohashs:
             out.write(" ".join([f"{ghash}" for ghash in chunk_geohashs]) + "\n")
+    with open(args.outfolder / "manifest.json", "w") as out:
+        json.dump(manifest(processed_geohashs, args.compression), out, indent=1)
+
 
 if __name__ == "__main__":
     main()
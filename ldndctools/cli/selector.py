@@ -1,29 +1,83 @@
 import logging
-from typing import Dict, Iterable, Optional
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple, Union
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 import questionary
+import shapely
+import xarray as xr
 from questionary.prompts.common import Choice, Separator
 from shapely.geometry import Polygon
+from shapely.strtree import STRtree
 
 from ldndctools.misc.types import BoundingBox, RES
+from ldndctools.sources.admin import (
+    AdminIndex,
+    open_admin_index,
+    prepare_df_countries,
+    RegionGeometries,
+)
 
 logging.getLogger("fiona").setLevel(logging.WARNING)
 
+# NOTE: MLT is missing in LR dataset
+EU27_CODES = [
+    "AUT",
+    "BEL",
+    "BGR",
+    "CYP",
+    "CZE",
+    "DEU",
+    "DNK",
+    "ESP",
+    "EST",
+    "FIN",
+    "FRA",
+    "GRC",
+    "HRV",
+    "HUN",
+    "IRL",
+    "ITA",
+    "LTU",
+    "LUX",
+    "LVA",
+    "MLT",
+    "NLD",
+    "POL",
+    "PRT",
+    "ROU",
+    "SVK",
+    "SVN",
+    "SWE",
+]
+
+EU_GROUPS = {
+    "EU27": EU27_CODES,
+    "EU28": sorted(EU27_CODES + ["GBR"]),
+    "EU28PLUS": sorted(EU27_CODES + ["GBR", "CHE", "NOR"]),
+}
+
+
+def _bbox_key(bbox: BoundingBox) -> Tuple[float, float, float, float]:
+    return bbox.x1, bbox.y1, bbox.x2, bbox.y2
+
 
 def clean_results(x: Iterable[str]) -> Iterable[str]:
     return [r for r in x if r != "BACK"]
 
 
-def prepare_df_countries(df: pd.DataFrame) -> pd.DataFrame:
-    return df[~df.ADM0_A3.isin(["ATF", "ATA"])].set_crs("EPSG:4326")
-
-
 def get_country_names(df: pd.DataFrame) -> Iterable[str]:
     return sorted(df.ADM0_A3.unique())
 
 
+def get_country_lookup(df: pd.DataFrame) -> Dict[str, str]:
+    """country code -> name (first entry of a code wins)"""
+    names = df.drop_duplicates("ADM0_A3").set_index("ADM0_A3").ADMIN
+    return names.sort_index().to_dict()
+
+
 def list_countries_in_domain(
     df: pd.DataFrame, *, domain: str, data: Optional[Dict[str, Iterable[str]]] = None
 ) -> Dict[str, Iterable[str]]:
@@ -32,14 +86,26 @@ def list_countries_in_domain(
         raise NotImplementedError
 
     data = data or {}
-    for group, gdf in df.groupby(domain):
-        data[group] = {
-            c: gdf.query(f"ADM0_A3=='{c}'").ADMIN.values.item()
-            for c in get_country_names(gdf)
-        }
+    names = df.drop_duplicates([domain, "ADM0_A3"]).set_index("ADM0_A3")
+    for group, admin in names.groupby(domain).ADMIN:
+        data[group] = admin.sort_index().to_dict()
     return data
 
 
+def list_countries_in_groups(
+    df: pd.DataFrame, *, domains: Iterable[str]
+) -> Dict[str, Dict[str, str]]:
+    """countries of all groups in domains plus the EU groups (sorted by group)"""
+    data = {}
+    for domain in domains:
+        data = list_countries_in_domain(df, domain=domain, data=data)
+
+    countries = get_country_lookup(df)
+    for group, codes in EU_GROUPS.items():
+        data[group] = {c: countries[c] for c in codes if c in countries}
+    return dict(sorted(data.items()))
+
+
 # TODO: this should be moved elsewhere
 def ask_for_region(self):
     """ask user for region to select (2-step process)"""
@@ -93,13 +159,27 @@ def ask_for_resolution(cfg):
 
 
 class Selector(object):
-    def __init__(self, df: pd.DataFrame):
+    def __init__(
+        self, df: pd.DataFrame, *, cache_dir: Optional[Union[str, Path]] = None
+    ):
         self._bbox = BoundingBox()
+        self._cache_dir = cache_dir
         self._df = prepare_df_countries(df)
         self._names = get_country_names(self._df)
-        self._selection = {
-            c: self._df.query(f"ADM0_A3=='{c}'").ADMIN.values[0] for c in self._names
-        }
+
+        # lookups are built once, properties only serve these
+        self._countries = get_country_lookup(self._df)
+        self._continents = list_countries_in_domain(self._df, domain="CONTINENT")
+        self._regions = list_countries_in_groups(
+            self._df, domains=["REGION_UN", "SUBREGION"]
+        )
+        self._selection = dict(self._countries)
+
+        # memoized geometries: dissolved selection and its clip to the bbox
+        self._dissolved: Optional[Tuple[FrozenSet[str], gpd.GeoDataFrame]] = None
+        self._clipped: Optional[Tuple[Tuple, Optional[gpd.GeoDataFrame]]] = None
+        self._tree: Optional[STRtree] = None
+        self._region_geometries: Optional[RegionGeometries] = None
 
     def extract_countries(self, selection: Iterable[str]) -> Dict[str, str]:
         # merge countries of (potentially) multiple regions
@@ -117,78 +197,33 @@ class Selector(object):
 
     @property
     def continents(self):
-        return list_countries_in_domain(self._df, domain="CONTINENT")
+        return self._continents
 
     @property
     def regions(self):
-        data = list_countries_in_domain(self._df, domain="REGION_UN")
-        data = list_countries_in_domain(self._df, domain="SUBREGION", data=data)
-
-        # extra
-        # NOTE: MLT is missing in LR dataset
-        eu27_codes = [
-            "AUT",
-            "BEL",
-            "BGR",
-            "CYP",
-            "CZE",
-            "DEU",
-            "DNK",
-            "ESP",
-            "EST",
-            "FIN",
-            "FRA",
-            "GRC",
-            "HRV",
-            "HUN",
-            "IRL",
-            "ITA",
-            "LTU",
-            "LUX",
-            "LVA",
-            "MLT",
-            "NLD",
-            "POL",
-            "PRT",
-            "ROU",
-            "SVK",
-            "SVN",
-            "SWE",
-        ]
-
-        eu28_codes = sorted(eu27_codes + ["GBR"])
-        eu28plus_codes = sorted(eu27_codes + ["GBR", "CHE", "NOR"])
-
-        def get_name(df, country_code):
-            try:
-                return df.query(f"ADM0_A3=='{country_code}'").ADMIN.values[0]
-            except ValueError:
-                pass
-
-        data["EU27"] = {
-            c: get_name(self._df, c) for c in eu27_codes if c in self._names
-        }
-        data["EU28"] = {
-            c: get_name(self._df, c) for c in eu28_codes if c in self._names
-        }
-        data["EU28PLUS"] = {
-            c: get_name(self._df, c) for c in eu28plus_codes if c in self._names
-        }
-
-        return dict(sorted(data.items()))
+        return self._regions
+
+    @property
+    def bbox(self) -> BoundingBox:
+        return self._bbox
 
     def set_bbox(self, bbox: BoundingBox) -> None:
+        if _bbox_key(bbox) != _bbox_key(self._bbox):
+            self._clipped = None
         self._bbox = bbox
 
     def set_region(self, region: Iterable[str]) -> None:
-        self._selection = self.extract_countries(region)
+        self._set_selection(self.extract_countries(region))
+
+    def _set_selection(self, selection: Dict[str, str]) -> None:
+        if set(selection) != set(self._selection):
+            self._dissolved = None
+            self._clipped = None
+        self._selection = selection
 
     @property
     def countries(self):
-        return {
-            c: self._df.query(f"ADM0_A3=='{c}'").ADMIN.values[0]
-            for c in sorted(self._df.ADM0_A3.unique())
-        }
+        return self._countries
 
     @property
     def selected(self):
@@ -203,36 +238,143 @@ class Selector(object):
         )
 
     @property
-    def gdf_mask(self):
-        if self.gdf is not None:
+    def region_geometries(self) -> RegionGeometries:
+        """pre-dissolved geometries of all continents and regions (cached)"""
+        if self._region_geometries is None:
+            self._region_geometries = RegionGeometries(
+                self._df,
+                {**self._continents, **self._regions},
+                cache_dir=self._cache_dir,
+            )
+        return self._region_geometries
+
+    def admin_index(self, grid: xr.DataArray) -> AdminIndex:
+        """country index of the grid cells (built once per grid and cached)"""
+        return open_admin_index(self._df, grid, cache_dir=self._cache_dir)
+
+    def _selected_region(self) -> Optional[str]:
+        """name of the continent/ region matching the selection exactly"""
+        key = set(self.selected)
+        for name, countries in {**self._continents, **self._regions}.items():
+            if key == set(countries):
+                return name
+        return None
+
+    @property
+    def gdf_dissolved(self) -> Optional[gpd.GeoDataFrame]:
+        """union of the selected countries (dissolved once per selection)"""
+        key = frozenset(self.selected)
+        if self._dissolved is None or self._dissolved[0] != key:
+            gdf, region = self.gdf, self._selected_region()
+            if gdf is None:
+                dissolved = None
+            elif region is not None:
+                dissolved = self.region_geometries.get(region)
+            else:
+                dissolved = (
+                    gdf.assign(dummy=0).dissolve(by="dummy").loc[:, ["geometry"]]
+                )
+            self._dissolved = (key, dissolved)
+        return self._dissolved[1]
+
+    @property
+    def gdf_display(self) -> Optional[gpd.GeoDataFrame]:
+        """selection for maps (simplified geometry if a whole region is selected)"""
+        region = self._selected_region()
+        if region is None:
+            return self.gdf_mask
+        return self._clip_to_bbox(self.region_geometries.get(region, simplified=True))
+
+    @property
+    def gdf_mask(self) -> Optional[gpd.GeoDataFrame]:
+        """selected countries clipped to the bbox (memoized)"""
+        key = (frozenset(self.selected), _bbox_key(self._bbox))
+        if self._clipped is None or self._clipped[0] != key:
+            self._clipped = (key, self._clip_to_bbox(self.gdf_dissolved))
+        return self._clipped[1]
+
+    def _clip_to_bbox(
+        self, dissolved: Optional[gpd.GeoDataFrame]
+    ) -> Optional[gpd.GeoDataFrame]:
+        if dissolved is not None:
             x1, x2, y1, y2 = self._bbox.x1, self._bbox.x2, self._bbox.y1, self._bbox.y2
             bbox_poly = Polygon([(x1, y1), (x1, y2), (x2, y2), (x2, y1), (x1, y1)])
-            bbox = gpd.GeoDataFrame([1], geometry=[bbox_poly], crs=self.gdf.crs)
+            bbox = gpd.GeoDataFrame([1], geometry=[bbox_poly], crs=dissolved.crs)
 
-            df = self.gdf.assign(dummy=0)
-            gdf_mask = gpd.clip(df.dissolve(by="dummy").loc[:, ["geometry"]], bbox)
+            gdf_mask = gpd.clip(dissolved, bbox)
             if len(gdf_mask) > 0:
                 return gdf_mask
         return None
 
+    @property
+    def tree(self) -> STRtree:
+        """spatial index over the admin polygons (built on first use)"""
+        if self._tree is None:
+            self._tree = STRtree(self._df.geometry.values)
+        return self._tree
+
+    def locate(self, lats, lons) -> np.ndarray:
+        """country codes of all points (None for points outside any country)
+
+        Points on a shared border get the code of the first matching polygon.
+        """
+        points = shapely.points(
+            np.atleast_1d(np.asarray(lons, dtype=float)),
+            np.atleast_1d(np.asarray(lats, dtype=float)),
+        )
+        pidx, gidx = self.tree.query(points, predicate="intersects")
+
+        # first matching polygon per point
+        order = np.lexsort((gidx, pidx))
+        pidx, gidx = pidx[order], gidx[order]
+        pidx, first = np.unique(pidx, return_index=True)
+        codes = np.full(len(points), None, dtype=object)
+        codes[pidx] = self._df.ADM0_A3.values[gidx[first]]
+        return codes
+
     def ask(self):
-        self._selection = ask_for_region(self)
+        self._set_selection(ask_for_region(self))
 
 
 class CoordinateSelection:
-    
+    """site list given by coordinates (and optional ids)"""
+
     def __init__(self, infile=None, lon="lon", lat="lat", cid="ID"):
         if infile:
-            df = pd.read_csv(infile, delim_whitespace=True)
-
-            self.lons = df[lon].values
-            self.lats = df[lat].values
-            self.ids  = df[cid].values if cid in list(df.columns) else range(len(self.lats))
+            df = pd.read_csv(infile, sep=r"\s+")
+
+            self.lons = df[lon].to_numpy(dtype=float)
+            self.lats = df[lat].to_numpy(dtype=float)
+            self.ids = (
+                df[cid].to_numpy()
+                if cid in list(df.columns)
+                else np.arange(len(self.lats))
+            )
         else:
-            self.lons = [lon]
-            self.lats = [lat]
-            self.ids  = [cid]
+            self.lons = np.array([lon])
+            self.lats = np.array([lat])
+            self.ids = np.array([cid])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def select(self, keep: np.ndarray) -> None:
+        """keep only the flagged coordinates"""
+        self.lons, self.lats = self.lons[keep], self.lats[keep]
+        self.ids = self.ids[keep]
 
     @property
     def selected(self):
         return dict({k: (v1, v2) for v1, v2, k in zip(self.lons, self.lats, self.ids)})
+
+    @property
+    def bbox(self) -> Optional[BoundingBox]:
+        """extent of the coordinates (with a margin of one degree)"""
+        if len(self) == 0:
+            return None
+        return BoundingBox(
+            x1=max(float(self.lons.min()) - 1, -180),
+            x2=min(float(self.lons.max()) + 1, 180),
+            y1=max(float(self.lats.min()) - 1, -90),
+            y2=min(float(self.lats.max()) + 1, 90),
+        )
@@ -12,6 +12,7 @@ from ldndctools.io.zipwriter import ZipWriter
 from ldndctools.misc.create_data import create_dataset
 from ldndctools.misc.helper import dataset_to_bytes, get_s3_link
 from ldndctools.misc.types import RES
+from ldndctools.sources.admin import read_admin
 from ldndctools.sources.soil.soil_iscricwise import ISRICWISE_SoilDataset
 
 
@@ -52,7 +53,7 @@ def load_admin_data(catalog, res: RES) -> pd.DataFrame:
     # 110m is pretty poor - LR also gets 50m
     res_scale_mapper = {RES.LR: 50, RES.MR: 50, RES.HR: 10}
 
-    df = catalog.admin(scale=res_scale_mapper[res]).read()
+    df = read_admin(catalog.admin(scale=res_scale_mapper[res]))
     return df
 
 
@@ -15,20 +15,13 @@
 import logging
 import os
 from importlib import resources
-from pathlib import Path
 
-import intake
-import numpy as np
 from pydantic import ValidationError
-from tqdm import tqdm
 
 from ldndctools.cli.cli import cli
-from ldndctools.cli.selector import ask_for_resolution, CoordinateSelection, Selector
-from ldndctools.extra import get_config, set_config
+from ldndctools.extra import get_config
 from ldndctools.misc.create_data import create_dataset
 from ldndctools.misc.types import BoundingBox, RES
-from ldndctools.sources.soil.soil_iscricwise import ISRICWISE_SoilDataset
-from ldndctools.sources.soil.soil_national import NATIONAL_SoilDataset
 
 log = logging.getLogger(__name__)
 log.setLevel("INFO")
@@ -45,6 +38,23 @@ def main( **kwargs):
     # parse args
     args = cli()
 
+    # deferred: the data stack is only imported after successful arg parsing
+    import intake
+    import numpy as np
+    from tqdm import tqdm
+
+    from ldndctools.cli.selector import (
+        ask_for_resolution,
+        CoordinateSelection,
+        Selector,
+    )
+    from ldndctools.misc.cache import source_checksum
+    from ldndctools.sources.admin import read_admin
+    from ldndctools.sources.soil.pyramid import open_derived_soil
+    from ldndctools.sources.soil.soil_composite import COMPOSITE_SoilDataset
+    from ldndctools.sources.soil.soil_iscricwise import ISRICWISE_SoilDataset
+    from ldndctools.sources.soil.soil_national import NATIONAL_SoilDataset
+
     # read config
     if 'config' in kwargs:
         cfg = kwargs['config']
@@ -121,19 +131,20 @@ def main( **kwargs):
     with resources.path("data", "catalog.yml") as cat:
         catalog = intake.open_catalog(str(cat))
 
-    df = catalog.admin(scale=res_scale_mapper[res]).read()
+    df = read_admin(catalog.admin(scale=res_scale_mapper[res]))
     
     print("config ", cfg)
-    if "soil" in cfg and cfg["soil"] == "national":
-        soil_raw = catalog.soil_national(res=res.name, port=8082).read()
-        print("soil_raw ",soil_raw)
-        soil = NATIONAL_SoilDataset( soil_raw)
-    else:
-        soil_raw = catalog.soil(res=res.name, port=8082).read()
-        soil = ISRICWISE_SoilDataset( soil_raw)
 
-    if False: #args.file:
+    if args.file:
         selector = CoordinateSelection(args.file)
+        log.info(f"Read {len(selector)} coordinates from {args.file}")
+        if rcode:
+            # only keep coordinates within the requested countries/ regions
+            regions = Selector(df)
+            codes = list(regions.extract_countries(rcode))
+            located = regions.locate(selector.lats, selector.lons)
+            selector.select(np.isin(located, codes))
+            log.info(f"{len(selector)} coordinates within {'+'.join(rcode)}")
     else:
         selector = Selector(df)
 
@@ -144,7 +155,7 @@ def main( **kwargs):
     #    if rcode:
     #        selector.set_region(rcode)
 
-    if bbox:
+    if bbox and isinstance(selector, Selector):
         log.info(f"Setting bounding box to {bbox}")
         selector.set_bbox(bbox)
         log.info(f"Setting bounding box to {bbox}")
@@ -163,6 +174,34 @@ def main( **kwargs):
 
     #log.info(selector.selected)
 
+    if cfg.get("store") == "tiled" and cfg.get("soil") in ("national", "composite"):
+        log.error(f"store: tiled only serves ISRIC-WISE soil, not {cfg['soil']}.")
+        exit(1)
+
+    if cfg.get("store") == "tiled":
+        # only fetch the soil tiles covering the selection
+        soil_raw = catalog.soil_tiled(res=res.name, port=8082).to_dask()
+        soil = ISRICWISE_SoilDataset.from_tiles(soil_raw, bbox=selector.bbox)
+    elif cfg.get("soil") == "composite":
+        # national data where available, isric-wise elsewhere
+        soil = COMPOSITE_SoilDataset(
+            catalog.soil_national(res=res.name, port=8082).read(),
+            catalog.soil(res=res.name, port=8082).read(),
+        )
+    elif "soil" in cfg and cfg["soil"] == "national":
+        soil_raw = catalog.soil_national(res=res.name, port=8082).read()
+        print("soil_raw ",soil_raw)
+        soil = NATIONAL_SoilDataset( soil_raw)
+    elif cfg.get("derive") and res != RES.HR:
+        # only fetch HR, coarser grids are derived once and cached locally
+        source = catalog.soil(res="HR", port=8082)
+        checksum = source_checksum(source.urlpath, source.storage_options)
+        soil_raw = open_derived_soil(source.to_dask(), res, checksum=checksum)
+        soil = ISRICWISE_SoilDataset(soil_raw)
+    else:
+        soil_raw = catalog.soil(res=res.name, port=8082).read()
+        soil = ISRICWISE_SoilDataset( soil_raw)
+
     with tqdm(total=1) as progressbar:
         xml, nc = create_dataset(soil, selector, res, cfg, progressbar)
 
@@ -174,6 +213,9 @@ def main( **kwargs):
             "siteid": {"dtype": "int32", "_FillValue": -1, "zlib": True},
             "soilmask": {"dtype": "int32", "_FillValue": -1, "zlib": True},
         }
+        if isinstance(soil, COMPOSITE_SoilDataset):
+            nc["source"] = soil.provenance.sel(lat=nc.lat, lon=nc.lon)
+            ENCODING["source"] = {"dtype": "int8", "zlib": True}
         nc.to_netcdf(cfg["outfile"].replace(".xml", ".nc"), encoding=ENCODING)
 
 if __name__ == "__main__":
@@ -6,7 +6,6 @@ import os
 import shutil
 
 import yaml
-from pkg_resources import Requirement, resource_filename
 
 log = logging.getLogger(__name__)
 
@@ -20,6 +19,7 @@ def _copy_default_config():
     """ copy default conf file to user dir """
 
     # TODO somewhat redundand, merge with set_config code
+    from pkg_resources import Requirement, resource_filename
 
     fname = resource_filename(Requirement.parse("ldndctools"), "data/ldndctools.conf")
     shutil.copyfile(fname, os.path.join(os.path.expanduser("~"), "ldndctools.conf"))
@@ -100,6 +100,19 @@ def get_config(cfgFile=None):
     return cfg
 
 
+def get_config_section(section, cfgFile=None):
+    """ return section of the config file (empty if there is none) """
+    if cfgFile is not None and not os.path.isfile(cfgFile):
+        log.critical("Specified configuration file not found.")
+        exit(1)
+
+    cfgFile = cfgFile or _find_config()
+    if cfgFile is None:
+        return {}
+
+    return (_parse_config(cfgFile) or {}).get(section) or {}
+
+
 def set_config(cfg):
     """ write cfg file to user dir """
     fname = os.path.join(os.path.expanduser("~"), "ldndc2nc.conf")
@@ -96,7 +96,7 @@ def widget_clip(self):
 
 
 def widget_main(self):
-    my_map = create_map(self.selector.gdf_mask, bbox=self.state["bbox"])
+    my_map = create_map(self.selector.gdf_display, bbox=self.state["bbox"])
     my_map.fit_bounds(bbox_to_bounds(self.state["bbox"]))
     folium_static(my_map)
 
@@ -0,0 +1,207 @@
+"""archives of independently compressed members with a sidecar index
+
+An archive is a concatenation of gzip members (like BGZF) or zstd frames, so
+any gzip (zstd) reader decompresses it as a whole. Members added with a key are
+listed in a sidecar index (archive name + INDEX_SUFFIX, lines
+"key<TAB>offset<TAB>length"), so a single member is read with one seek and
+decompressed on its own.
+
+Members are compressed by a pool of threads (zlib and zstd release the GIL)
+while the caller prepares the next ones, like pigz. At most a few members per
+thread are held in memory, they are written in order.
+"""
+import gzip
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Deque, Dict, NamedTuple, Optional, Tuple, Union
+
+from ldndctools.misc.cache import atomic_path
+
+__all__ = [
+    "CODECS",
+    "INDEX_SUFFIX",
+    "Member",
+    "BlockArchiveWriter",
+    "compressor",
+    "decompress",
+    "index_path",
+    "read_index",
+    "open_index",
+    "read_member",
+]
+
+INDEX_SUFFIX = ".idx"
+
+
+class Codec(NamedTuple):
+    suffix: str
+    level: int  # default level
+
+
+CODECS = {"gzip": Codec(".gz", 6), "zstd": Codec(".zst", 3)}
+
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+class Member(NamedTuple):
+    path: Path
+    offset: int
+    length: int
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ModuleNotFoundError:
+        raise ModuleNotFoundError(
+            "Module 'zstandard' is not installed. zstd compression not available"
+        )
+    return zstandard
+
+
+def compressor(codec: str = "gzip", level: Optional[int] = None) -> Callable:
+    """function compressing bytes into one member (gzip member or zstd frame)"""
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec: {codec} (use one of {', '.join(CODECS)})")
+    level = CODECS[codec].level if level is None else level
+
+    if codec == "zstd":
+        zstandard = _zstandard()
+        # compressor objects must not be shared between threads
+        return lambda data: zstandard.ZstdCompressor(level=level).compress(data)
+    return lambda data: gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def decompress(data: bytes) -> bytes:
+    """decompress gzip members or a zstd frame (written by compressor)"""
+    if data.startswith(_ZSTD_MAGIC):
+        return _zstandard().ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def index_path(path: Union[str, Path]) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + INDEX_SUFFIX)
+
+
+class BlockArchiveWriter:
+    """write compressed members to path, the index is written on close
+
+    With threads > 1 members are compressed in a thread pool, add only blocks
+    while 2 * threads members are pending. Used as a context manager, an
+    exception removes the partial archive (no index is written for it).
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        *,
+        codec: str = "gzip",
+        level: Optional[int] = None,
+        threads: int = 1,
+    ):
+        self.path = Path(path)
+        self.index: Dict[str, Member] = {}
+        self._compress = compressor(codec, level)
+        self._pool = ThreadPoolExecutor(threads) if threads > 1 else None
+        self._pending: Deque[Tuple[Optional[str], Future]] = deque()
+        self._max_pending = 2 * threads
+        self._file = open(self.path, "wb")
+
+    def add(self, data: bytes, key: Optional[str] = None) -> None:
+        """append data as one member (indexed if a key is given)"""
+        if key is not None and (
+            key in self.index or any(key == k for k, _ in self._pending)
+        ):
+            raise ValueError(f"Duplicate archive member: {key}")
+
+        if self._pool is None:
+            self._write(key, self._compress(data))
+            return
+
+        self._pending.append((key, self._pool.submit(self._compress, data)))
+        while len(self._pending) > self._max_pending:
+            self._write(*self._pop())
+
+    def _pop(self) -> Tuple[Optional[str], bytes]:
+        key, future = self._pending.popleft()
+        return key, future.result()
+
+    def _write(self, key: Optional[str], member: bytes) -> None:
+        entry = Member(self.path, self._file.tell(), len(member))
+        self._file.write(member)
+        if key is not None:
+            self.index[key] = entry
+
+    def close(self) -> None:
+        """write the pending members and the index"""
+        if self._file.closed:
+            return
+        try:
+            while self._pending:
+                self._write(*self._pop())
+        except BaseException:
+            self.abort()
+            raise
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+            self._file.close()
+        with atomic_path(index_path(self.path)) as tmp:
+            with open(tmp, "w") as out:
+                for key, entry in self.index.items():
+                    out.write(f"{key}\t{entry.offset}\t{entry.length}\n")
+
+    def abort(self) -> None:
+        """stop writing and remove the partial archive (and any stale index)"""
+        for _, future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        if self._pool is not None:
+            self._pool.shutdown()
+        self._file.close()
+        for path in (self.path, index_path(self.path)):
+            if path.exists():
+                path.unlink()
+
+    def __enter__(self) -> "BlockArchiveWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def read_index(path: Union[str, Path]) -> Dict[str, Member]:
+    """members (by key) of the archive path"""
+    path = Path(path)
+    index = {}
+    with open(index_path(path)) as f:
+        for line in f:
+            key, offset, length = line.rstrip("\n").split("\t")
+            index[key] = Member(path, int(offset), int(length))
+    return index
+
+
+def open_index(folder: Union[str, Path], pattern: str = "*") -> Dict[str, Member]:
+    """members (by key) of all indexed archives of a folder"""
+    index: Dict[str, Member] = {}
+    for path in sorted(Path(folder).glob(pattern)):
+        if not index_path(path).is_file():
+            continue
+        members = read_index(path)
+        duplicates = index.keys() & members.keys()
+        if duplicates:
+            raise ValueError(f"Members in several archives: {sorted(duplicates)[:5]}")
+        index.update(members)
+    return index
+
+
+def read_member(member: Member) -> bytes:
+    """decompressed data of one member (one seek and read)"""
+    with open(member.path, "rb") as f:
+        f.seek(member.offset)
+        return decompress(f.read(member.length))
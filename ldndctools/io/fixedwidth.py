@@ -0,0 +1,138 @@
+"""vectorized fixed-width text formatting (byte-identical to np.savetxt)
+
+Numeric blocks are rendered into a (rows, line width) byte matrix column by
+column: values are scaled to integers (value * 10**precision), split into
+integer and fraction digits and written with a few array operations per digit
+position. Rows that cannot be rendered exactly this way fall back to Python
+string formatting:
+
+* non-finite values (nan, inf)
+* values too large to be scaled exactly (|value| * 10**precision >= 2**52)
+* values too close to a rounding tie (the decimal rounding of the exact binary
+  value cannot be decided from the scaled float)
+* values that do not fit the field width
+"""
+import re
+from typing import List, NamedTuple, Tuple
+
+import numpy as np
+
+__all__ = ["FieldSpec", "parse_format", "format_fixed"]
+
+_FIELD = re.compile(r"%(-?)(\d+)\.(\d+)f")
+
+# scaled values beyond this are not exact integers in float64
+_MAX_SCALED = 2.0**52
+
+_SPACE, _ZERO, _MINUS = ord(" "), ord("0"), ord("-")
+
+# relative distance to a rounding tie that is still considered ambiguous (a few
+# ulps of the scaled value, which carries a rounding error of up to half an ulp)
+_TIE_EPS = 2.0**-50
+
+
+class FieldSpec(NamedTuple):
+    width: int
+    precision: int
+    left: bool
+
+
+def parse_format(fmt: str) -> List[FieldSpec]:
+    """field specs of a printf format made of %[-]W.Pf fields only"""
+    fields = [
+        FieldSpec(int(w), int(p), left == "-") for left, w, p in _FIELD.findall(fmt)
+    ]
+    if not fields or _FIELD.sub("", fmt):
+        raise ValueError(f"Unsupported format: {fmt!r} (only %[-]W.Pf fields)")
+    return fields
+
+
+def _ndigits(x: np.ndarray) -> np.ndarray:
+    """number of decimal digits of non-negative integers (0 has one digit)"""
+    n = np.ones(x.shape, dtype=np.int64)
+    limit = 10
+    while True:
+        more = x >= limit
+        if not more.any():
+            return n
+        n += more
+        limit *= 10
+
+
+def _render_column(x: np.ndarray, spec: FieldSpec) -> Tuple[np.ndarray, np.ndarray]:
+    """(width, rows) text of column x and the rows that need a fallback"""
+    width, precision, left = spec
+    scale = 10**precision
+
+    with np.errstate(invalid="ignore", over="ignore"):
+        scaled = np.abs(x) * scale
+        fallback = ~np.isfinite(scaled) | (scaled >= _MAX_SCALED)
+        scaled = np.where(fallback, 0.0, scaled)
+        tie = np.abs(scaled - np.floor(scaled) - 0.5)
+        fallback |= tie <= scaled * _TIE_EPS
+
+    q = np.rint(scaled)
+    q = q.astype(np.uint32 if q.max(initial=0) < 2**32 else np.uint64)
+    neg = np.signbit(x)
+    ndig = _ndigits(q // scale)
+    length = neg + ndig + (precision + 1 if precision else 0)
+    fallback |= length > width
+
+    # right-aligned text (transposed, a digit position is one contiguous row)
+    block = np.full((2 * width, len(x)), _SPACE, dtype=np.uint8)
+    for d in range(precision):
+        q, digit = np.divmod(q, 10)
+        block[width - 1 - d] = _ZERO + digit
+    base = width - 1
+    if precision:
+        block[width - 1 - precision] = ord(".")
+        base -= precision + 1
+    for d in range(min(int(ndig.max(initial=1)), base) + 1):
+        q, digit = np.divmod(q, 10)
+        char = np.where(d < ndig, _ZERO + digit, _SPACE)
+        block[base - d] = np.where((d == ndig) & neg, _MINUS, char)
+
+    if not left:
+        return block[:width], fallback
+
+    # left-justify: shift each value by its padding (one gather)
+    pad = np.where(fallback, 0, width - length)
+    index = (np.arange(width)[:, np.newaxis] + pad) * len(x) + np.arange(len(x))
+    return block.ravel().take(index), fallback
+
+
+def format_fixed(values: np.ndarray, fmt: str, newline: str = "\n") -> str:
+    """format a 2d numeric array row by row, same as np.savetxt(..., fmt=fmt)"""
+    specs = parse_format(fmt)
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, np.newaxis]
+    if values.shape[1] != len(specs):
+        raise ValueError(
+            f"Format {fmt!r} has {len(specs)} fields, data {values.shape[1]} columns"
+        )
+
+    nrows = len(values)
+    linewidth = sum(s.width for s in specs) + len(newline)
+    # text is assembled transposed (one row per character position)
+    out = np.empty((linewidth, nrows), dtype=np.uint8)
+    out[linewidth - len(newline) :] = np.frombuffer(newline.encode(), np.uint8)[
+        :, np.newaxis
+    ]
+
+    fallback = np.zeros(nrows, dtype=bool)
+    offset = 0
+    for j, spec in enumerate(specs):
+        block, invalid = _render_column(values[:, j], spec)
+        out[offset : offset + spec.width] = block
+        fallback |= invalid
+        offset += spec.width
+
+    out = np.ascontiguousarray(out.T)
+    if not fallback.any():
+        return out.tobytes().decode()
+
+    lines = out.view(f"S{linewidth}").ravel().astype(object)
+    for n in np.flatnonzero(fallback):
+        lines[n] = (fmt % tuple(values[n]) + newline).encode()
+    return b"".join(lines).decode()
@@ -1,6 +1,6 @@
-import xml.dom.minidom as md
 import xml.etree.cElementTree as et
 from typing import Any, Dict, Iterable, List, Optional, Tuple
+from xml.sax.saxutils import quoteattr
 
 import numpy as np
 import xarray as xr
@@ -8,6 +8,7 @@ from pydantic import ValidationError
 
 from ldndctools.misc.geohash import coords2geohash_dec
 from ldndctools.misc.helper import mutually_exclusive
+from ldndctools.misc.spatial import snap_to_grid
 from ldndctools.misc.types import LayerData, RES
 from ldndctools.misc.xmlclasses import SiteXML
 from ldndctools.sources.soil.soil_base import SoilDataset
@@ -15,19 +16,22 @@ from ldndctools.sources.soil.soil_base import SoilDataset
 
 def translate_data_format(d: xr.Dataset) -> List[LayerData]:
     """translate data from nc soil file (point-wise xarray sel) to new naming/ units"""
+    return translate_layers({name: da.values for name, da in d.data_vars.items()})
 
-    data: List[LayerData] = []
-    for lev in d.lev:
-        ld = LayerData()
 
+def translate_layers(values: Dict[str, np.ndarray]) -> List[LayerData]:
+    """translate layer arrays of a site (one value per lev) to LayerData"""
+
+    data: List[LayerData] = []
+    for lev in range(len(values["depth"])):
         # TODO: catch this more elegantly via mask/ layer_mask
-        if np.isnan(d.sel(lev=lev)["depth"]):
+        if np.isnan(values["depth"][lev]):
             continue
 
-        for varname, value in d.data_vars.items():
-            da = value.sel(lev=lev).values.item()  # type: ignore
+        ld = LayerData()
+        for varname, column in values.items():
             try:
-                setattr(ld, varname, da)
+                setattr(ld, varname, column[lev].item())
             except ValidationError:
                 setattr(ld, varname, None)
         data.append(ld)
@@ -65,6 +69,7 @@ class SiteXmlWriter:
         id_selection: Optional[Iterable[int]] = None,
         id_array: Optional[xr.DataArray] = None,
         coords: Optional[Iterable[Tuple[float, float]]] = None,
+        coord_ids: Optional[Iterable[int]] = None,
         extra_split: Optional[bool] = True,
     ) -> str:
 
@@ -80,89 +85,105 @@ class SiteXmlWriter:
         Lcids: List[int] = []
         Lix: List[int] = []
         Ljx: List[int] = []
-        Dcids: Dict[Tuple[float, float], int] = {}
-
-        for j in range(len(self.soil.coords["lat"])):
-            for i in range(len(self.soil.coords["lon"])):
-                if id_array:
-                    cid: int = id_array.isel(lat=j, lon=i)
-                else:
-                    cid: int = coords2geohash_dec(
-                        lat=self.soil.coords["lat"][j].values.item(),
-                        lon=self.soil.coords["lon"][i].values.item(),
-                    )
-                if id_selection:
-                    if cid not in id_selection:
-                        continue
-
-                ids[j, i] = cid
-                Lcids.append(cid)
-                Lix.append(i)
-                Ljx.append(j)
-                Dcids[
-                    (
-                        self.soil.coords["lat"].values[j],
-                        self.soil.coords["lon"].values[i],
+
+        if coords is not None:
+            # (lon, lat) list: snap all coordinates to grid cells at once
+            lons, lats = np.asarray(list(coords), dtype=float).reshape(-1, 2).T
+            Ljx = snap_to_grid(self.soil.coords["lat"].values, lats).tolist()
+            Lix = snap_to_grid(self.soil.coords["lon"].values, lons).tolist()
+            if coord_ids is not None:
+                Lcids = list(coord_ids)
+            else:
+                Lcids = [
+                    coords2geohash_dec(
+                        lat=self.soil.coords["lat"].values[j].item(),
+                        lon=self.soil.coords["lon"].values[i].item(),
                     )
-                ] = cid
+                    for j, i in zip(Ljx, Lix)
+                ]
+            # a cell shared by several coordinates shows the first id
+            jj, ii = np.asarray(Ljx), np.asarray(Lix)
+            nlon = len(self.soil.coords["lon"])
+            _, first = np.unique(jj * nlon + ii, return_index=True)
+            ids.values[jj[first], ii[first]] = np.asarray(Lcids)[first]
+        else:
+            for j in range(len(self.soil.coords["lat"])):
+                for i in range(len(self.soil.coords["lon"])):
+                    if id_array:
+                        cid: int = id_array.isel(lat=j, lon=i)
+                    else:
+                        cid: int = coords2geohash_dec(
+                            lat=self.soil.coords["lat"][j].values.item(),
+                            lon=self.soil.coords["lon"][i].values.item(),
+                        )
+                    if id_selection:
+                        if cid not in id_selection:
+                            continue
+
+                    ids[j, i] = cid
+                    Lcids.append(cid)
+                    Lix.append(i)
+                    Ljx.append(j)
 
         self.ids = ids * self.mask
 
-        def create_chunks(items: List[int]) -> List[List[int]]:
-            block = 200
-            return [items[item : item + block] for item in range(0, len(items), block)]
-
-        Lcids2d = create_chunks(Lcids)
-        Lix2d = create_chunks(Lix)
-        Ljx2d = create_chunks(Ljx)
+        # each cell is read once, coordinates sharing a cell get a site each
+        nlon = len(self.soil.coords["lon"])
+        cells, inverse = np.unique(
+            np.asarray(Ljx, dtype=int) * nlon + np.asarray(Lix, dtype=int),
+            return_inverse=True,
+        )
+        order = np.argsort(inverse, kind="stable")
+        points = np.split(order, np.cumsum(np.bincount(inverse))[:-1])
 
-        sites = []
+        sites: Dict[int, str] = {}
+        description: Optional[et.Element] = None
 
         # NOTE: Possibly some selection missing
         step = 0
-        total_steps = self.number_of_sites
-
-        for Lix, Ljx, Lcids in zip(Lix2d, Ljx2d, Lcids2d):
+        total_steps = len(Lcids) if coords is not None else self.number_of_sites
+        lev1 = int(np.flatnonzero(self.soil.coords["lev"].values == 1)[0])
 
+        block = 200
+        for start in range(0, len(cells), block):
+            block_cells = cells[start : start + block]
             subset = self.soil.isel(
-                lat=xr.DataArray(np.array(Ljx), dims="points"),
-                lon=xr.DataArray(np.array(Lix), dims="points"),
+                lat=xr.DataArray(block_cells // nlon, dims="cells"),
+                lon=xr.DataArray(block_cells % nlon, dims="cells"),
             )
 
-            for point in subset.points:
-                d = subset.sel(points=point)
-                lat, lon = float(d.lat), float(d.lon)
+            # gather the soil data of all cells in bulk
+            lats = subset.lat.values
+            lons = subset.lon.values
+            values = {
+                name: da.transpose("cells", "lev").values
+                for name, da in subset.data_vars.items()
+            }
 
-                # take point sel and return dict with modified data naming/ units
+            for cell in range(len(block_cells)):
                 # TODO: do proper mask checking
-                if not np.isnan(d.sel(lev=1)["depth"].values.item()):
-                    data = translate_data_format(d)
-
-                    site = SiteXML(
-                        lat=lat, lon=lon, id=Dcids[(lat, lon)]
-                    )  # **BASEINFO)
-
-                    add_site = False
-                    for i, lay in enumerate(data):
-                        assert i < 5, "Currently max of 5 layers expected"
-
-                        # abort if we have no valid data for layer
-                        if None in [lay.ph, lay.bd, lay.clay, lay.sand]:
-                            break
-
-                        # default iron percentage
-                        lay.iron = 0.01
-
-                        if i == 0 and extra_split:
-                            site.add_soil_layer(
-                                lay, litter=False, extra_split=extra_split
-                            )
-                        else:
-                            site.add_soil_layer(lay, litter=False)
-                        add_site = True
-
-                    if add_site:
-                        sites.append(site)
+                if np.isnan(values["depth"][cell, lev1]):
+                    continue
+
+                # the site of a cell is built once, its points only differ by id
+                site = self._site(
+                    {name: v[cell] for name, v in values.items()},
+                    lat=float(lats[cell]),
+                    lon=float(lons[cell]),
+                    extra_split=extra_split,
+                )
+                if site is not None:
+                    description = site.find("description")
+                    site.remove(description)
+                    et.indent(site, space="\t", level=1)
+                    text = et.tostring(site, encoding="unicode")
+                    body = text[text.index(">") :]
+                    coords = f'lat="{site.get("lat")}" lon="{site.get("lon")}"'
+
+                for point in points[start + cell]:
+                    if site is not None:
+                        cid = quoteattr(str(Lcids[point]))
+                        sites[point] = f"\t<site id={cid} {coords}{body}"
 
                     if progressbar:
                         if hasattr(progressbar, "progress"):
@@ -174,12 +195,39 @@ class SiteXmlWriter:
                     if status_widget:
                         status_widget.warning(f"{(step/total_steps)*100:.1f}% done")
 
-        # create xml
-        xml = et.Element("ldndcsite")
-        for site_cnt, site in enumerate(sites):
-            x = site.xml.find("description")
-            if site_cnt == 0:
-                xml.append(x)
-            site.xml.remove(x)
-            xml.append(site.xml)
-        return md.parseString(et.tostring(xml)).toprettyxml()
+        # create xml (sites are serialized already)
+        lines = ['<?xml version="1.0" ?>', "<ldndcsite>"]
+        if description is not None:
+            lines.append("\t" + et.tostring(description, encoding="unicode"))
+        lines.extend(sites[p] for p in sorted(sites))
+        lines.append("</ldndcsite>")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _site(
+        values: Dict[str, np.ndarray], *, lat: float, lon: float, extra_split: bool
+    ) -> Optional[et.Element]:
+        """site element of the layer arrays of a cell, None if no layer is valid"""
+        # return dict with modified data naming/ units
+        data = translate_layers(values)
+
+        site = SiteXML(lat=lat, lon=lon)  # **BASEINFO)
+
+        add_site = False
+        for i, lay in enumerate(data):
+            assert i < 5, "Currently max of 5 layers expected"
+
+            # abort if we have no valid data for layer
+            if None in [lay.ph, lay.bd, lay.clay, lay.sand]:
+                break
+
+            # default iron percentage
+            lay.iron = 0.01
+
+            if i == 0 and extra_split:
+                site.add_soil_layer(lay, litter=False, extra_split=extra_split)
+            else:
+                site.add_soil_layer(lay, litter=False)
+            add_site = True
+
+        return site.xml if add_site else None
@@ -0,0 +1,43 @@
+"""location of local caches for derived datasets"""
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Union
+
+# same default as the simplecache storage in data/catalog.yml
+DEFAULT_CACHE_DIR = ".cache"
+
+
+def get_cache_dir(cache_dir: Optional[Union[str, Path]] = None) -> Path:
+    """return (and create) the cache folder (arg > $LDNDCTOOLS_CACHE > .cache)"""
+    path = Path(cache_dir or os.environ.get("LDNDCTOOLS_CACHE", DEFAULT_CACHE_DIR))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def source_checksum(urlpath: str, storage_options: Optional[Dict] = None) -> str:
+    """checksum of the (current version of the) source file"""
+    import fsspec
+
+    (of,) = fsspec.open_files(urlpath, **(storage_options or {}))
+    return f"{of.fs.checksum(of.path):x}"[:16]
+
+
+@contextmanager
+def atomic_path(path: Union[str, Path]) -> Iterator[Path]:
+    """temporary path (same folder) that replaces path if the block succeeds
+
+    Concurrent or interrupted writers never leave a partial file at path.
+    """
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(
+        prefix=f".{path.stem}.", suffix=path.suffix, dir=path.parent
+    )
+    os.close(fd)
+    try:
+        yield Path(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
@@ -1,28 +1,39 @@
-from typing import Any, Optional, Union
+from typing import Any, Optional, TYPE_CHECKING, Union
 
 import logging
 import numpy as np
-import rioxarray  # noqa
-import xarray as xr
 
 from ldndctools.misc.geohash import coords2geohash_dec
-from ldndctools.cli.selector import CoordinateSelection, Selector
-from ldndctools.io.xmlwriter import SiteXmlWriter
 from ldndctools.misc.types import RES
-from ldndctools.sources.soil.soil_base import SoilDataset
+
+# the selector, writer and soil stack (geopandas, rioxarray, ...) are imported
+# on first use, so importing this module stays cheap
+if TYPE_CHECKING:
+    from ldndctools.cli.selector import CoordinateSelection, Selector
+    from ldndctools.sources.soil.soil_base import SoilDataset
 
 log = logging.getLogger(__name__)
 
 log.setLevel("DEBUG")
 
+# max distance (deg) for nearest valid soil cell lookups
+MAX_SEARCH_DISTANCE = 10.0
+
+# max distance (grid cells) a coordinate is snapped to a valid soil cell: the
+# containing cell or one of its neighbours
+SNAP_TOLERANCE = 1.5
+
 def create_dataset(
-    soil: SoilDataset,
-    selector: Union[Selector, CoordinateSelection],
+    soil: "SoilDataset",
+    selector: Union["Selector", "CoordinateSelection"],
     res: RES,
     args,
     progressbar: Optional[Any] = None,
     status_widget: Optional[Any] = None,
     ):
+    from ldndctools.cli.selector import CoordinateSelection, Selector
+    from ldndctools.io.xmlwriter import SiteXmlWriter
+
     # soil = soil.load()
     # soil = soil.rio.write_crs(4326)
 
@@ -34,61 +45,74 @@ def create_dataset(
 
         # clip region selection
         soil.clip_mask_box(
-            minx=selector._bbox.x1,
-            miny=selector._bbox.y1,
-            maxx=selector._bbox.x2,
-            maxy=selector._bbox.y2,
+            minx=selector.bbox.x1,
+            miny=selector.bbox.y1,
+            maxx=selector.bbox.x2,
+            maxy=selector.bbox.y2,
         )
-        soil.clip_mask(selector.gdf_mask.geometry, all_touched=True)
+        # cells touched by the selected countries (precomputed, cached index)
+        index = selector.admin_index(soil.source_mask)
+        soil.clip_mask_cells(index.mask(selector.selected.keys()))
 
         xmlwriter = SiteXmlWriter(soil, res=res)
         if ('lat' in args) and ('lon' in args):
-            delta = 0
-            found = False
-            while not found:
-                for la in [-1,1]:
-                    for lo in [-1,1]:
-                        if not found:
-                            sel = soil._soil.sel(lat=args["lat"]+la*delta, lon=args["lon"]+lo*delta, method='nearest')
-                            if sel['TopDep'].mean() > 0:
-                                found = True
-                delta += 0.1
-                if delta > 10:
-                    log.info("No valid data to process for this region/ bbox request.")
-                    exit(1)
-
-            cid = coords2geohash_dec( lat=sel["lat"].values.item(), lon=sel["lon"].values.item())
+            # nearest cell with valid soil data
+            index = soil.cell_index
+            j, i, _ = index.query(
+                args["lat"], args["lon"], max_distance=MAX_SEARCH_DISTANCE
+            )
+            if j[0] < 0:
+                log.info("No valid data to process for this region/ bbox request.")
+                exit(1)
+
+            cid = coords2geohash_dec(
+                lat=index.lat[j[0]].item(), lon=index.lon[i[0]].item()
+            )
             site_xml = xmlwriter.write(progressbar=progressbar, status_widget=status_widget, id_selection=[cid])
         else:
             site_xml = xmlwriter.write(progressbar=progressbar, status_widget=status_widget)
 
-    else:
-        log.info("Incorrect selector.")
-        exit(1)
-        # WARNING: THIS BRANCH IS DEFUNCT!!!
-        soil.clip_mask_box(
-            minx=min(selector.lons),
-            miny=min(selector.lats),
-            maxx=max(selector.lons),
-            maxy=max(selector.lats),
-        )
+    elif isinstance(selector, CoordinateSelection):
+        log.info("Using CoordinateSelection")
+
+        # snap all coordinates to a nearby valid soil cell at once
+        index = soil.cell_index
+        tolerance = SNAP_TOLERANCE * index.spacing
+        j, i, _ = index.query(selector.lats, selector.lons, max_distance=tolerance)
 
-        results = []
-        for lat, lon in zip(selector.lats, selector.lons):
-            results.append(soil.data.sel(lat=lat, lon=lon, method="nearest"))
+        ids = np.asarray(selector.ids)
+        found = j >= 0
+        if not found.all():
+            missing = ", ".join(str(cid) for cid in ids[~found][:10])
+            more = ", ..." if np.sum(~found) > 10 else ""
+            log.warning(
+                f"No soil data within {tolerance:.3g}° for {np.sum(~found)} "
+                f"coordinates (skipped ids: {missing}{more})"
+            )
+        if not found.any():
+            log.info("No valid data to process for these coordinates.")
+            exit(1)
 
-        soil_new = xr.ones_like(soil.data) * np.nan
-        for p in results:
-            for v in soil.data_vars:
-                soil_new[v].loc[dict(lat=p.lat, lon=p.lon)] = p[v]
+        # coordinates sharing a cell keep their id (the cell is read once)
+        ids, j, i = ids[found], j[found], i[found]
+        cells = len(np.unique(j * len(index.lon) + i))
+        if cells < len(ids):
+            log.info(f"{len(ids)} coordinates share {cells} soil cells")
 
-        xmlwriter = SiteXmlWriter(soil_new, res=res)
+        soil.select_cells(j, i)
+
+        xmlwriter = SiteXmlWriter(soil, res=res)
         site_xml = xmlwriter.write(
             progressbar=progressbar,
             status_widget=status_widget,
-            coords=zip(selector.lons, selector.lats),
+            coords=zip(index.lon[i], index.lat[j]),
+            coord_ids=ids.tolist(),
         )
 
+    else:
+        log.info("Incorrect selector.")
+        exit(1)
+
     site_nc = xmlwriter.arrays
 
     return site_xml, site_nc
@@ -1,2 +1,6 @@
 class ParameterMissingError(Exception):
     pass
+
+
+class EmptySelectionError(ValueError):
+    pass
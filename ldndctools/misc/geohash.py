@@ -6,6 +6,8 @@
 
 from typing import Tuple
 
+import numpy as np
+
 ch32 = "0123456789bcdefghjkmnpqrstuvwxyz"
 bool2ch = {f"{i:05b}": ch for i, ch in enumerate(ch32)}
 ch2bool = {v: k for k, v in bool2ch.items()}
@@ -85,3 +87,39 @@ def geohash_dec2coords(*, geohash_dec: int, pre: int = 6) -> Tuple[float, float]
     return round(sum(res[0]) / 2, max(3, pre - 3)), round(
         sum(res[1]) / 2, max(3, pre - 3)
     )
+
+
+def dec2cells(hash_dec: np.ndarray, pre: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(lat, lon) numbers (from south, west) of the cells of decimal geohashes"""
+    hash_dec = np.asarray(hash_dec, dtype=np.int64)
+    lat = np.zeros(hash_dec.shape, dtype=np.int64)
+    lon = np.zeros(hash_dec.shape, dtype=np.int64)
+    nbits = pre * 5
+    for k in range(nbits):
+        bit = (hash_dec >> (nbits - 1 - k)) & 1
+        if k % 2:
+            lat = lat << 1 | bit
+        else:
+            lon = lon << 1 | bit
+    return lat, lon
+
+
+def common_prefix(first: int, last: int, pre: int = 6) -> str:
+    """longest common prefix of two decimal geohashes (precision pre)"""
+    a, b = dec2hash(first, pre), dec2hash(last, pre)
+    n = 0
+    while n < pre and a[n] == b[n]:
+        n += 1
+    return a[:n]
+
+
+def cells_bbox(hash_dec: np.ndarray, pre: int = 6) -> Tuple[float, float, float, float]:
+    """bounding box (x1, y1, x2, y2) of the cells of decimal geohashes"""
+    lat, lon = dec2cells(hash_dec, pre)
+    dx, dy = 360 / 2 ** ((pre * 5 + 1) // 2), 180 / 2 ** (pre * 5 // 2)
+    return (
+        float(-180 + lon.min() * dx),
+        float(-90 + lat.min() * dy),
+        float(-180 + (lon.max() + 1) * dx),
+        float(-90 + (lat.max() + 1) * dy),
+    )
@@ -4,17 +4,11 @@ import os
 import xml.dom.minidom as md
 import xml.etree.cElementTree as et
 from functools import wraps
-from typing import Any, Iterable
+from typing import Any, Iterable, TYPE_CHECKING
 
-import boto3
-import netCDF4
-import xarray as xr
-from dotenv import load_dotenv
-
-load_dotenv()
-
-AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
-AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
+# heavy dependencies are imported where they are used (fast cli startup)
+if TYPE_CHECKING:
+    import xarray as xr
 
 logging.getLogger("boto3").setLevel(logging.WARNING)
 logging.getLogger("botocore").setLevel(logging.WARNING)
@@ -40,8 +34,10 @@ def mutually_exclusive(keyword: str, *keywords: str):
 
 
 # hack to convert xarray to in-memory bytes
-def dataset_to_bytes(ds: xr.Dataset, name: str = "my-dataset") -> bytes:
+def dataset_to_bytes(ds: "xr.Dataset", name: str = "my-dataset") -> bytes:
     """Converts dataset to bytes."""
+    import netCDF4
+    import xarray as xr
 
     nc4_ds = netCDF4.Dataset(name, mode="w", diskless=True, memory=ds.nbytes)
     nc4_store = xr.backends.NetCDF4DataStore(nc4_ds)
@@ -59,6 +55,13 @@ def get_s3_link(
     bucket_name: str,
     endpoint_url: str = "https://s3.imk-ifu.kit.edu:8082",
 ) -> str:
+    import boto3
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
+    AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
+
     session = boto3.Session(
         aws_access_key_id=AWS_ACCESS_KEY_ID,
         aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
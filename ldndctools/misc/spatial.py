@@ -0,0 +1,127 @@
+"""spatial lookups on regular lat/lon grids"""
+from typing import Optional, Tuple
+
+import numpy as np
+import xarray as xr
+from scipy.spatial import cKDTree
+
+__all__ = [
+    "lonlat_to_xyz",
+    "snap_to_grid",
+    "grid_index",
+    "align_to_grid",
+    "NearestCellIndex",
+]
+
+
+def lonlat_to_xyz(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """convert lat/lon (degrees) to cartesian coordinates on the unit sphere"""
+    lat, lon = np.radians(lats), np.radians(lons)
+    return np.stack(
+        [np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1
+    )
+
+
+def snap_to_grid(coord: np.ndarray, values) -> np.ndarray:
+    """indices of the nearest entries of a monotonic 1d coordinate for all values"""
+    coord = np.asarray(coord)
+    values = np.atleast_1d(np.asarray(values, dtype=float))
+    if len(coord) == 1:
+        return np.zeros(len(values), dtype=np.int64)
+
+    descending = coord[0] > coord[-1]
+    if descending:
+        coord = coord[::-1]
+
+    idx = np.clip(np.searchsorted(coord, values), 1, len(coord) - 1)
+    idx = idx - ((values - coord[idx - 1]) <= (coord[idx] - values))
+    return len(coord) - 1 - idx if descending else idx
+
+
+def grid_index(coord: np.ndarray, values, tolerance: float) -> np.ndarray:
+    """indices of the entries of coord matching values within tolerance, else -1"""
+    coord = np.asarray(coord)
+    values = np.atleast_1d(np.asarray(values, dtype=float))
+    idx = snap_to_grid(coord, values)
+    return np.where(np.abs(coord[idx] - values) <= tolerance, idx, -1)
+
+
+def align_to_grid(
+    da: xr.DataArray, lat, lon, *, tolerance: Optional[float] = None
+) -> xr.DataArray:
+    """values of a (lat, lon) grid on another grid by integer index mapping
+
+    Every target cell takes the value of the nearest source cell within
+    tolerance (default: half the source cell size), other cells are nan.
+    Unlike interpolation the values are not blended, binary masks stay exact.
+    """
+    da = da.transpose("lat", "lon")
+    lat, lon = np.asarray(lat), np.asarray(lon)
+
+    def index(coord, values):
+        if tolerance is not None:
+            return grid_index(coord, values, tolerance)
+        cells = coord if len(coord) > 1 else values
+        step = np.abs(np.diff(cells)).min() if len(cells) > 1 else 0.0
+        return grid_index(coord, values, 0.5 * step)
+
+    j, i = index(da.lat.values, lat), index(da.lon.values, lon)
+    values = np.asarray(da.values, dtype=float)
+    values = values[np.ix_(np.maximum(j, 0), np.maximum(i, 0))]
+    values[(j < 0)[:, np.newaxis] | (i < 0)] = np.nan
+    return xr.DataArray(
+        values, dims=("lat", "lon"), coords={"lat": lat, "lon": lon}, name=da.name
+    )
+
+
+def _chord_to_degrees(chord: np.ndarray) -> np.ndarray:
+    return np.degrees(2 * np.arcsin(np.clip(chord * 0.5, 0, 1)))
+
+
+def _degrees_to_chord(degrees: float) -> float:
+    return 2 * np.sin(np.radians(min(degrees, 180.0)) * 0.5)
+
+
+class NearestCellIndex:
+    """nearest valid grid cell lookup (kd-tree on unit sphere coordinates)"""
+
+    def __init__(self, valid: xr.DataArray):
+        self.lat = valid["lat"].values
+        self.lon = valid["lon"].values
+        self._j, self._i = np.nonzero(valid.transpose("lat", "lon").values)
+        self._tree = cKDTree(lonlat_to_xyz(self.lat[self._j], self.lon[self._i]))
+
+    def __len__(self) -> int:
+        return len(self._j)
+
+    @property
+    def spacing(self) -> float:
+        """grid spacing (degrees, the coarser of lat and lon)"""
+        steps = [np.abs(np.diff(c)).min() for c in (self.lat, self.lon) if len(c) > 1]
+        return float(max(steps)) if steps else 0.0
+
+    def query(
+        self, lats, lons, *, max_distance: Optional[float] = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """grid indices (j, i) and great circle distance (degrees) of nearest cells
+
+        Points without a valid cell within max_distance get index -1 and an
+        infinite distance.
+        """
+        xyz = lonlat_to_xyz(
+            np.atleast_1d(np.asarray(lats, dtype=float)),
+            np.atleast_1d(np.asarray(lons, dtype=float)),
+        )
+        upper = np.inf if max_distance is None else _degrees_to_chord(max_distance)
+
+        if len(self) == 0:
+            missing = np.full(len(xyz), -1)
+            return missing, missing.copy(), np.full(len(xyz), np.inf)
+
+        chord, k = self._tree.query(xyz, distance_upper_bound=upper)
+        found = np.isfinite(chord)
+        k = np.where(found, k, 0)
+
+        j = np.where(found, self._j[k], -1)
+        i = np.where(found, self._i[k], -1)
+        return j, i, np.where(found, _chord_to_degrees(chord), np.inf)
@@ -71,6 +71,9 @@ nmap = {
     "BotDep": ("botd", 1, 0),
 }
 
+# significant digits by ldndc name
+DIGITS = {name: significant for name, _, significant in nmap.values()}
+
 
 class LayerData(BaseModel):
     depth: conint(gt=0) = 20
@@ -123,17 +126,11 @@ class LayerData(BaseModel):
 
         # format significant digits
         def _format(var: str, value: float) -> str:
-            k, _, significant = tuple(zip(*nmap.values()))
-            Ddigits = dict(zip(k, significant))
-            if var in Ddigits:
-                return str(round(value, Ddigits[var]))
+            if var in DIGITS:
+                return str(round(value, DIGITS[var]))
             elif var in ["wcmin", "wcmax"]:
                 return str(round(value, 2))
             return str(value)
 
-        data = json.loads(
-            json.dumps(cls, indent=2, default=pydantic_encoder).replace(
-                "null", str(NODATA)
-            )
-        )
+        data = {k: NODATA if v is None else v for k, v in cls.model_dump().items()}
         return {k: _format(k, v) for k, v in data.items() if k not in ignore}
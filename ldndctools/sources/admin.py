@@ -0,0 +1,386 @@
+"""country index of the soil grids (precomputed rasterization of the admin layer)
+
+Clipping the soil mask with dissolved country polygons on every run is slow
+for the 10m admin layer at HR. Instead, the admin layer is rasterized once per
+grid (at global extent, windows are sliced from it) and cached:
+
+* an int16 raster with the country (position in `codes` + 1, 0: none) that
+  holds the cell centre
+* a per-country index of all cells touched by the country polygons
+
+Any union of countries then is a concatenation of the per-country indices.
+
+The parsed admin layer itself is cached as GeoParquet (keyed by the checksum
+of the source file, which also keys the caches derived from it). Region
+geometries (continents, subregions, EU groups, ...) are dissolved once and
+persisted as GeoParquet, in full precision (clipping) and simplified (display).
+"""
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+import xarray as xr
+from affine import Affine
+from rasterio import features
+
+from ldndctools.misc.cache import atomic_path, get_cache_dir, source_checksum
+
+__all__ = [
+    "prepare_df_countries",
+    "read_admin",
+    "AdminIndex",
+    "open_admin_index",
+    "dissolve_regions",
+    "RegionGeometries",
+]
+
+log = logging.getLogger(__name__)
+
+NODATA = 0
+
+# columns used by ldndctools (read from the geoparquet cache)
+ADMIN_COLUMNS = ["ADM0_A3", "ADMIN", "CONTINENT", "REGION_UN", "SUBREGION", "geometry"]
+
+# attribute of admin layers read by read_admin: checksum of the source file
+CHECKSUM_ATTR = "checksum"
+
+# simplification tolerance (deg) of the display geometries
+SIMPLIFY_TOLERANCE = 0.05
+
+
+def prepare_df_countries(df: pd.DataFrame) -> pd.DataFrame:
+    return df[~df.ADM0_A3.isin(["ATF", "ATA"])].set_crs("EPSG:4326")
+
+
+def read_admin(
+    source,
+    *,
+    columns: Optional[Iterable[str]] = ADMIN_COLUMNS,
+    cache_dir: Optional[Union[str, Path]] = None,
+) -> gpd.GeoDataFrame:
+    """read the admin layer (intake source) via a geoparquet cache
+
+    The cache holds the layer already passed through prepare_df_countries and
+    is keyed by the source file checksum. Only columns are read from it.
+    """
+    checksum = source_checksum(source.urlpath, source.storage_options)
+    stem = Path(source.urlpath).name.split(".")[0]
+    path = get_cache_dir(cache_dir) / f"{stem}_{checksum}.parquet"
+
+    if not path.is_file():
+        log.info(f"Caching admin layer {source.urlpath}")
+        with atomic_path(path) as tmp:
+            prepare_df_countries(source.read()).to_parquet(tmp)
+
+    df = gpd.read_parquet(path, columns=list(columns) if columns else None)
+    # cache key of derived data (see _update_digest)
+    df.attrs[CHECKSUM_ATTR] = checksum
+    return df
+
+
+def _grid_spacing(coord: np.ndarray) -> float:
+    return float(np.abs(coord[-1] - coord[0]) / max(len(coord) - 1, 1))
+
+
+def _north_up(lat: np.ndarray, lon: np.ndarray) -> Tuple[Affine, bool]:
+    """affine transform (cell edges) of the grid flipped to north-up order"""
+    dx, dy = _grid_spacing(lon), _grid_spacing(lat)
+    flipped = len(lat) > 1 and lat[0] < lat[-1]
+    north = (lat.max() if flipped else lat[0]) + dy * 0.5
+    return Affine(dx, 0, lon[0] - dx * 0.5, 0, -dy, north), flipped
+
+
+def _touched_cells(geometry, transform: Affine, shape: Tuple[int, int]) -> np.ndarray:
+    """flat (north-up) indices of all cells touched by geometry"""
+    nlat, nlon = shape
+    minx, miny, maxx, maxy = geometry.bounds
+    west, north, dx, dy = transform.c, transform.f, transform.a, -transform.e
+
+    # rasterize the bounding window only (one cell margin)
+    i0 = max(int(np.floor((minx - west) / dx)) - 1, 0)
+    i1 = min(int(np.ceil((maxx - west) / dx)) + 1, nlon)
+    j0 = max(int(np.floor((north - maxy) / dy)) - 1, 0)
+    j1 = min(int(np.ceil((north - miny) / dy)) + 1, nlat)
+    if i1 <= i0 or j1 <= j0:
+        return np.empty(0, dtype=np.int64)
+
+    burned = features.rasterize(
+        [(geometry, 1)],
+        out_shape=(j1 - j0, i1 - i0),
+        transform=transform * Affine.translation(i0, j0),
+        all_touched=True,
+        dtype=np.uint8,
+    )
+    jj, ii = np.nonzero(burned)
+    return (jj + j0) * nlon + (ii + i0)
+
+
+def _update_digest(h, df: pd.DataFrame) -> None:
+    """add the admin layer to h (the source checksum if read by read_admin)"""
+    h.update("|".join(df.ADM0_A3).encode())
+    if CHECKSUM_ATTR in df.attrs:
+        h.update(df.attrs[CHECKSUM_ATTR].encode())
+        return
+    for wkb in df.geometry.to_wkb():
+        h.update(wkb)
+
+
+def _global_axis(coord: np.ndarray, lo: float, hi: float) -> Tuple[np.ndarray, int]:
+    """regular coord extended to [lo, hi] and the position of coord in it
+
+    Irregular (or single cell) coordinates are returned unchanged.
+    """
+    if len(coord) < 2:
+        return coord, 0
+    step = (coord[-1] - coord[0]) / (len(coord) - 1)
+    if not np.allclose(np.diff(coord), step, rtol=0, atol=abs(step) * 1e-3):
+        return coord, 0
+
+    d, low = abs(step), coord.min()
+    lo, hi = min(lo, low), max(hi, coord.max())
+    before = int(np.floor((low - lo) / d + 1e-6))
+    start = low - before * d
+    n = int(np.floor((hi - start) / d + 1e-6)) + 1
+    axis = np.round(start + d * np.arange(n), 6)
+    if step > 0:
+        return axis, before
+    return axis[::-1], len(axis) - before - len(coord)
+
+
+def admin_digest(df: pd.DataFrame, lat: np.ndarray, lon: np.ndarray) -> str:
+    """cache key of the admin layer and target grid"""
+    h = hashlib.sha1()
+    for coord in (lat, lon):
+        h.update(np.ascontiguousarray(coord, dtype=np.float64).tobytes())
+    _update_digest(h, df)
+    return h.hexdigest()[:16]
+
+
+class AdminIndex:
+    """country raster and per-country cell index of a lat/lon grid"""
+
+    def __init__(
+        self,
+        codes: np.ndarray,
+        offsets: np.ndarray,
+        cells: np.ndarray,
+        raster: np.ndarray,
+        lat: np.ndarray,
+        lon: np.ndarray,
+    ):
+        self.codes = np.asarray(codes).astype(str)
+        self.offsets = offsets
+        self.cells = cells
+        self.raster = raster
+        self.lat = lat
+        self.lon = lon
+        self._position = {c: n for n, c in enumerate(self.codes)}
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, lat: np.ndarray, lon: np.ndarray) -> "AdminIndex":
+        """rasterize the admin layer (one row per country) onto the grid"""
+        lat, lon = np.asarray(lat), np.asarray(lon)
+        transform, flipped = _north_up(lat, lon)
+        shape = (len(lat), len(lon))
+
+        countries = df.dissolve(by="ADM0_A3").geometry
+        codes = countries.index.values.astype(str)
+
+        cells = [_touched_cells(g, transform, shape) for g in countries.values]
+        offsets = np.cumsum([0] + [len(c) for c in cells])
+        cells = np.concatenate(cells) if len(cells) else np.empty(0, np.int64)
+
+        raster = features.rasterize(
+            zip(countries.values, range(1, len(codes) + 1)),
+            out_shape=shape,
+            transform=transform,
+            fill=NODATA,
+            dtype=np.int16,
+        )
+        if flipped:
+            j, i = np.divmod(cells, len(lon))
+            cells = (len(lat) - 1 - j) * len(lon) + i
+            raster = raster[::-1]
+
+        return cls(codes, offsets, cells.astype(np.int32), raster, lat, lon)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "AdminIndex":
+        with np.load(path) as data:
+            return cls(**{k: data[k] for k in data.files})
+
+    def window(
+        self, j0: int, i0: int, lat: np.ndarray, lon: np.ndarray
+    ) -> "AdminIndex":
+        """index of the sub grid (lat, lon) starting at cell (j0, i0)"""
+        j, i = np.divmod(self.cells, len(self.lon))
+        j, i = j - j0, i - i0
+        keep = (j >= 0) & (j < len(lat)) & (i >= 0) & (i < len(lon))
+        offsets = np.concatenate([[0], np.cumsum(keep)])[self.offsets]
+        cells = (j * len(lon) + i)[keep].astype(np.int32)
+        raster = self.raster[j0 : j0 + len(lat), i0 : i0 + len(lon)]
+        return AdminIndex(self.codes, offsets, cells, raster, lat, lon)
+
+    def save(self, path: Union[str, Path]) -> None:
+        np.savez_compressed(
+            path,
+            codes=self.codes,
+            offsets=self.offsets,
+            cells=self.cells,
+            raster=self.raster,
+            lat=self.lat,
+            lon=self.lon,
+        )
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self.lat), len(self.lon)
+
+    def _positions(self, codes: Iterable[str]) -> np.ndarray:
+        return np.array(
+            [self._position[c] for c in codes if c in self._position], dtype=int
+        )
+
+    def cells_of(self, codes: Iterable[str]) -> np.ndarray:
+        """sorted flat indices of all cells touched by the given countries"""
+        parts = [
+            self.cells[self.offsets[n] : self.offsets[n + 1]]
+            for n in self._positions(codes)
+        ]
+        return np.unique(np.concatenate(parts)) if parts else np.empty(0, np.int32)
+
+    def mask(self, codes: Iterable[str], *, all_touched: bool = True) -> np.ndarray:
+        """boolean (lat, lon) mask of the given countries"""
+        if all_touched:
+            keep = np.zeros(self.lat.size * self.lon.size, dtype=bool)
+            keep[self.cells_of(codes)] = True
+            return keep.reshape(self.shape)
+        return np.isin(self.raster, self._positions(codes) + 1)
+
+    def to_dataarray(self) -> xr.DataArray:
+        """country raster (position in codes + 1, 0: none)"""
+        return xr.DataArray(
+            self.raster,
+            coords={"lat": self.lat, "lon": self.lon},
+            dims=("lat", "lon"),
+            name="country",
+            attrs={"codes": " ".join(self.codes)},
+        )
+
+
+def open_admin_index(
+    df: pd.DataFrame,
+    grid: xr.DataArray,
+    *,
+    cache_dir: Optional[Union[str, Path]] = None,
+) -> AdminIndex:
+    """return country index of the grid (lat/lon coords), built once and cached
+
+    Regular grids are indexed at global extent, so any window of the same grid
+    (bounding boxes, tiles) is sliced from one cached index.
+    """
+    lat, lon = grid["lat"].values, grid["lon"].values
+    glat, j0 = _global_axis(lat, -90, 90)
+    glon, i0 = _global_axis(lon, -180, 180)
+    name = f"admin_index_{len(glat)}x{len(glon)}_{admin_digest(df, glat, glon)}.npz"
+    path = get_cache_dir(cache_dir) / name
+
+    if path.is_file():
+        index = AdminIndex.load(path)
+    else:
+        log.info(f"Building country index for {len(glat)}x{len(glon)} grid")
+        index = AdminIndex.build(df, glat, glon)
+        with atomic_path(path) as tmp:
+            index.save(tmp)
+
+    if index.shape == (len(lat), len(lon)):
+        return index
+    return index.window(j0, i0, lat, lon)
+
+
+def dissolve_regions(
+    df: pd.DataFrame, groups: Dict[str, Iterable[str]]
+) -> gpd.GeoDataFrame:
+    """union of the country polygons of each group (name -> country codes)"""
+    names = list(groups)
+    geometries = [
+        shapely.union_all(df.geometry.values[df.ADM0_A3.isin(list(groups[n]))])
+        for n in names
+    ]
+    return gpd.GeoDataFrame({"name": names}, geometry=geometries, crs=df.crs)
+
+
+class RegionGeometries:
+    """pre-dissolved region geometries, persisted as GeoParquet and loaded by name
+
+    Both variants (full precision and simplified) are built on first use and
+    cached, keyed by the admin layer, the groups and the tolerance.
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        groups: Dict[str, Iterable[str]],
+        *,
+        cache_dir: Optional[Union[str, Path]] = None,
+        tolerance: float = SIMPLIFY_TOLERANCE,
+    ):
+        self._df = df
+        self._groups = {name: sorted(codes) for name, codes in groups.items()}
+        self._cache_dir = cache_dir
+        self._tolerance = tolerance
+        self._paths: Optional[Dict[bool, Path]] = None
+        self._loaded: Dict[Tuple[str, bool], gpd.GeoDataFrame] = {}
+
+    @property
+    def names(self) -> Iterable[str]:
+        return list(self._groups)
+
+    def _digest(self) -> str:
+        h = hashlib.sha1()
+        _update_digest(h, self._df)
+        for name, codes in sorted(self._groups.items()):
+            h.update(f"{name}:{'|'.join(codes)};".encode())
+        h.update(str(self._tolerance).encode())
+        return h.hexdigest()[:16]
+
+    @property
+    def paths(self) -> Dict[bool, Path]:
+        """geoparquet files (key: simplified), written on first access"""
+        if self._paths is None:
+            folder, digest = get_cache_dir(self._cache_dir), self._digest()
+            paths = {
+                False: folder / f"regions_{digest}.parquet",
+                True: folder / f"regions_{digest}_simplified.parquet",
+            }
+            if not all(p.is_file() for p in paths.values()):
+                log.info(f"Dissolving {len(self._groups)} region geometries")
+                full = dissolve_regions(self._df, self._groups)
+                simplified = full.assign(
+                    geometry=full.geometry.simplify(
+                        self._tolerance, preserve_topology=True
+                    )
+                )
+                for gdf, path in [(full, paths[False]), (simplified, paths[True])]:
+                    with atomic_path(path) as tmp:
+                        gdf.to_parquet(tmp)
+            self._paths = paths
+        return self._paths
+
+    def get(self, name: str, *, simplified: bool = False) -> gpd.GeoDataFrame:
+        """geometry of region name (only this row is read from the cache)"""
+        if name not in self._groups:
+            raise KeyError(name)
+
+        key = (name, simplified)
+        if key not in self._loaded:
+            gdf = gpd.read_parquet(
+                self.paths[simplified], filters=[("name", "==", name)]
+            )
+            self._loaded[key] = gdf.loc[:, ["geometry"]]
+        return self._loaded[key]
@@ -0,0 +1,97 @@
+"""time-major chunk layout of climate stores for per-site extraction
+
+Climate archives (ERA5-Land) are chunked for maps: large spatial chunks of a
+few time steps. Extracting the time series of a site touches one chunk per few
+time steps. A time-major store holds long time chunks of small spatial tiles,
+so the series of a tile is read from a few large, sequential chunks.
+
+The conversion copies the data in regions of (time steps, rows, columns) that
+span a common multiple of the source chunk and the tile: every source chunk is
+read once and every target chunk written once, and one copy task (per
+variable) holds at most max_mem bytes.
+"""
+from pathlib import Path
+from typing import Mapping, Tuple, Union
+
+import numpy as np
+import xarray as xr
+
+__all__ = [
+    "LAYOUT_ATTR",
+    "TIME_MAJOR",
+    "is_time_major",
+    "time_major_chunks",
+    "to_time_major",
+]
+
+# dataset attribute that records the chunk layout of a store
+LAYOUT_ATTR = "chunk_layout"
+TIME_MAJOR = "time-major"
+
+DIMS = ("time", "lat", "lon")
+
+
+def is_time_major(ds: xr.Dataset) -> bool:
+    """data stems from a time-major store (written by to_time_major)"""
+    return ds.attrs.get(LAYOUT_ATTR) == TIME_MAJOR
+
+
+def _max_chunk(ds: xr.Dataset, dim: str) -> int:
+    return max(ds.chunks[dim]) if ds.chunks else ds.sizes[dim]
+
+
+def time_major_chunks(
+    ds: xr.Dataset, *, tile: int, max_mem: int
+) -> Tuple[Tuple[int, int, int], Tuple[int, int, int]]:
+    """(copy region, target chunk) shapes (time, lat, lon) of a time-major copy
+
+    Target chunks are tile x tile cells with as many time steps as a copy region
+    of max_mem bytes allows. Copy regions span the least common multiple of the
+    source chunk and the tile (lat, lon) and whole source time chunks where
+    possible, so their boundaries are both source chunk and tile boundaries.
+    Regions too large for max_mem are split at tile boundaries (the source
+    chunks are then read more than once).
+    """
+    ntime, ny, nx = (ds.sizes[d] for d in DIMS)
+    itemsize = max(v.dtype.itemsize for v in ds.data_vars.values())
+    ct = _max_chunk(ds, "time")
+    ty, tx = min(tile, ny), min(tile, nx)
+
+    ry = min(int(np.lcm(_max_chunk(ds, "lat"), ty)), ny)
+    rx = min(int(np.lcm(_max_chunk(ds, "lon"), tx)), nx)
+    while min(ct, ntime) * ry * rx * itemsize > max_mem and (ry > ty or rx > tx):
+        if ry >= rx and ry > ty:
+            ry = max(ry // 2 // ty * ty, ty)
+        else:
+            rx = max(rx // 2 // tx * tx, tx)
+
+    steps = max(max_mem // (ry * rx * itemsize), 1)
+    if steps >= ct:
+        steps = steps // ct * ct
+    steps = min(steps, ntime)
+    return (steps, ry, rx), (steps, ty, tx)
+
+
+def to_time_major(
+    ds: xr.Dataset,
+    store: Union[str, Path],
+    *,
+    tile: int = 10,
+    max_mem: int = 2**30,
+) -> Mapping[str, Tuple[int, int, int]]:
+    """copy climate data into a time-major zarr store
+
+    Returns the shapes of the copy regions and of the chunks of the store.
+    """
+    copy, target = time_major_chunks(ds, tile=tile, max_mem=max_mem)
+
+    ds = ds.transpose(*DIMS, ...).chunk(dict(zip(DIMS, copy)))
+    ds = ds.assign_attrs({LAYOUT_ATTR: TIME_MAJOR})
+    encoding = {}
+    for name, var in ds.variables.items():
+        var.encoding.pop("chunks", None)
+        var.encoding.pop("preferred_chunks", None)
+        if var.dims == DIMS:
+            encoding[name] = {"chunks": target}
+    ds.to_zarr(store, mode="w", consolidated=True, encoding=encoding)
+    return {"copy": copy, "chunks": target}
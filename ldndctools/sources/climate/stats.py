@@ -0,0 +1,46 @@
+"""annual climate statistics (site file header) in a single pass over the data
+
+The complete time series of the sites of a block is in memory (cdgen writes
+block by block), the years are reduced with numpy reduceat (min, max, sum,
+mean per year) and then averaged.
+"""
+import numpy as np
+
+__all__ = ["STATS", "annual_block_stats", "site_stats"]
+
+# statistics (mean over years) of the site header
+STATS = ["tavg", "tamp", "prec", "wind"]
+
+
+def annual_block_stats(
+    tavg: np.ndarray, prec: np.ndarray, wind: np.ndarray, years: np.ndarray
+) -> np.ndarray:
+    """annual statistics of a block of complete years (time is the last axis)
+
+    Returns an array (stat, ..., year) with mean temperature, temperature
+    amplitude ((max - min) / 2), precipitation sum and mean wind speed of
+    every year. NaNs are skipped (all-NaN: NaN, for the precipitation sum 0).
+    """
+    _, starts = np.unique(years, return_index=True)
+
+    def nansum(x):
+        return np.add.reduceat(np.where(np.isnan(x), 0, x), starts, axis=-1)
+
+    def nanmean(x):
+        count = np.add.reduceat(~np.isnan(x), starts, axis=-1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(count > 0, nansum(x) / count, np.nan)
+
+    tmax = np.fmax.reduceat(tavg, starts, axis=-1)
+    tmin = np.fmin.reduceat(tavg, starts, axis=-1)
+    return np.stack([nanmean(tavg), (tmax - tmin) / 2, nansum(prec), nanmean(wind)])
+
+
+def site_stats(
+    tavg: np.ndarray, prec: np.ndarray, wind: np.ndarray, years: np.ndarray
+) -> np.ndarray:
+    """mean annual statistics (stat, ...) of in-memory data (time is the last axis)"""
+    annual = annual_block_stats(tavg, prec, wind, years)
+    count = np.sum(~np.isnan(annual), axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, np.nansum(annual, axis=-1) / count, np.nan)
@@ -0,0 +1,190 @@
+"""derive coarser soil grids (MR, LR, ...) from the HR source by block-mode
+
+The soil attributes are a function of the dominant soil unit (SUID) of a cell.
+A coarse cell therefore gets the most frequent valid SUID of its block and
+the attributes of the first fine cell carrying that SUID.
+"""
+import argparse
+import logging
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+import dask
+import numpy as np
+import xarray as xr
+
+from ldndctools.misc.cache import atomic_path, get_cache_dir
+from ldndctools.misc.types import RES
+
+__all__ = ["block_mode_index", "coarsen_mode", "build_pyramid", "open_derived_soil"]
+
+log = logging.getLogger(__name__)
+
+# coarsening factors relative to the HR grid (0.083°)
+RES_FACTOR: Dict[RES, int] = {RES.HR: 1, RES.MR: 3, RES.LR: 6}
+
+
+def block_mode_index(blocks: np.ndarray) -> np.ndarray:
+    """index (last axis) of the first cell holding the block mode, -1 if no data
+
+    Cells with non-finite or non-positive ids are nodata, ties are resolved
+    towards the smaller id.
+    """
+    valid = np.isfinite(blocks) & (blocks > 0)
+    values = np.where(valid, blocks, np.inf)
+
+    order = np.argsort(values, axis=-1, kind="stable")
+    ordered = np.take_along_axis(values, order, axis=-1)
+
+    pos = np.arange(ordered.shape[-1])
+    is_start = np.ones(ordered.shape, dtype=bool)
+    is_start[..., 1:] = ordered[..., 1:] != ordered[..., :-1]
+    run_start = np.maximum.accumulate(np.where(is_start, pos, 0), axis=-1)
+
+    # running length of each run of identical ids, nodata never wins
+    run_length = np.where(np.isfinite(ordered), pos - run_start + 1, 0)
+    best = np.argmax(run_length, axis=-1)[..., np.newaxis]
+
+    first = np.take_along_axis(run_start, best, axis=-1)
+    index = np.take_along_axis(order, first, axis=-1)[..., 0]
+    return np.where(valid.any(axis=-1), index, -1)
+
+
+def _gather(values: np.ndarray, index: np.ndarray) -> np.ndarray:
+    """pick values at index (last axis), nodata blocks become nan"""
+    index = np.broadcast_to(index, values.shape[:-1])
+    picked = np.take_along_axis(values, np.maximum(index, 0)[..., np.newaxis], -1)
+    return np.where(index >= 0, picked[..., 0], np.nan)
+
+
+def coarsen_mode(ds: xr.Dataset, factor: int, *, var: str = "SUID") -> xr.Dataset:
+    """coarsen soil dataset by factor using the block mode of var"""
+    if factor == 1:
+        return ds
+
+    blocks = (
+        ds.drop_vars(["lat", "lon"])
+        .coarsen(lat=factor, lon=factor, boundary="trim")
+        .construct(lat=("lat", "lat_cell"), lon=("lon", "lon_cell"))
+        .stack(cell=("lat_cell", "lon_cell"))
+        .drop_vars(["cell", "lat_cell", "lon_cell"])
+    )
+
+    index = xr.apply_ufunc(
+        block_mode_index,
+        blocks[var],
+        input_core_dims=[["cell"]],
+        dask="parallelized",
+        output_dtypes=[np.int64],
+    )
+
+    coarse = xr.Dataset(attrs=ds.attrs)
+    for name, da in blocks.data_vars.items():
+        if "cell" not in da.dims:
+            coarse[name] = da
+            continue
+        coarse[name] = xr.apply_ufunc(
+            _gather,
+            da,
+            index,
+            input_core_dims=[["cell"], []],
+            dask="parallelized",
+            output_dtypes=[np.float64],
+        ).transpose(*ds[name].dims)
+        coarse[name].attrs = ds[name].attrs
+
+    coords = {
+        dim: ds[dim].coarsen({dim: factor}, boundary="trim").mean()
+        for dim in ["lat", "lon"]
+    }
+    for dim, coord in coords.items():
+        coord.attrs = ds[dim].attrs
+    return coarse.assign_coords(coords)
+
+
+def build_pyramid(
+    ds: xr.Dataset, factors: Optional[Dict[str, int]] = None, *, var: str = "SUID"
+) -> Dict[str, xr.Dataset]:
+    """return coarsened datasets (lazy if ds is dask-backed) for all factors"""
+    factors = factors or {r.name: f for r, f in RES_FACTOR.items() if f > 1}
+    return {name: coarsen_mode(ds, f, var=var) for name, f in factors.items()}
+
+
+def write_pyramid(
+    ds: xr.Dataset,
+    outfolder: Union[str, Path],
+    factors: Optional[Dict[str, int]] = None,
+    *,
+    prefix: str = "GLOBAL_WISESOIL_S1",
+) -> Dict[str, Path]:
+    """write all pyramid levels in one (parallel) pass over the source"""
+    outfolder = Path(outfolder)
+    outfolder.mkdir(parents=True, exist_ok=True)
+
+    paths, tasks = {}, []
+    for name, level in build_pyramid(ds, factors).items():
+        paths[name] = outfolder / f"{prefix}_{name}.nc"
+        tasks.append(level.to_netcdf(paths[name], compute=False))
+
+    # shared source chunks are only read once
+    dask.compute(*tasks)
+    return paths
+
+
+def open_derived_soil(
+    hr: xr.Dataset,
+    res: RES,
+    *,
+    checksum: Optional[str] = None,
+    cache_dir: Optional[Union[str, Path]] = None,
+) -> xr.Dataset:
+    """return soil data at res, derived from HR and cached locally
+
+    The cache is keyed by checksum (of the HR source file, default: a token of
+    the HR data), so a new source version is derived again.
+    """
+    factor = RES_FACTOR[res]
+    if factor == 1:
+        return hr
+
+    checksum = checksum or dask.base.tokenize(hr)[:16]
+    path = get_cache_dir(cache_dir) / f"GLOBAL_WISESOIL_S1_{res.name}_{checksum}.nc"
+    if not path.is_file():
+        log.info(f"Deriving {res.name} soil grid from HR (factor {factor})")
+        with atomic_path(path) as tmp:
+            coarsen_mode(hr, factor).to_netcdf(tmp)
+    with xr.open_dataset(path) as ds:
+        return ds.load()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)-8s] %(message)s")
+
+    parser = argparse.ArgumentParser(
+        description="Derive coarser soil grids from the HR soil file (block mode)"
+    )
+    parser.add_argument("infile", help="HR soil netcdf file")
+    parser.add_argument("outfolder", help="folder for the derived netcdf files")
+    parser.add_argument(
+        "-f",
+        "--factors",
+        dest="factors",
+        default="MR=3,LR=6",
+        help="name=factor pairs relative to the input grid (default: MR=3,LR=6)",
+    )
+    args = parser.parse_args()
+
+    try:
+        factors = {
+            k: int(v) for k, v in (f.split("=") for f in args.factors.split(","))
+        }
+    except ValueError:
+        parser.error(f"Illegal factors: {args.factors}")
+
+    with xr.open_dataset(args.infile, chunks={"lat": 720, "lon": 720}) as ds:
+        for name, path in write_pyramid(ds, args.outfolder, factors).items():
+            log.info(f"{name}: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,14 @@
 from abc import ABC, abstractmethod
-from typing import Any, Union
+from typing import Any, Optional, Union
 
 import geopandas as gpd
 import numpy as np
 import rioxarray  # noqa
 import xarray as xr
 
+from ldndctools.misc.spatial import NearestCellIndex
+from ldndctools.misc.types import BoundingBox
+from ldndctools.sources.soil.tiles import select_tiles
 from ldndctools.sources.soil.types import FullAttribute
 
 __all__ = []
@@ -39,6 +42,13 @@ class SoilDataset(ABC):
                 raise NotImplementedError(f"Defining {attr_name} is required")
         return super().__init_subclass__(**kwargs)
 
+    @classmethod
+    def from_tiles(
+        cls, soildata: xr.Dataset, *, bbox: Optional[BoundingBox] = None, **kwargs
+    ) -> "SoilDataset":
+        """create soil dataset from a (lazy) tiled store, only loading tiles in bbox"""
+        return cls(select_tiles(soildata, bbox).load(), **kwargs)
+
     @abstractmethod
     def _build_mask(self, soildata: xr.Dataset) -> xr.Dataset:
         pass
@@ -47,10 +57,16 @@ class SoilDataset(ABC):
     def _converter(self) -> Any:
         pass
 
+    def _keep_source_mask(self) -> None:
+        """remember the unclipped mask before the first clip operation"""
+        if getattr(self, "_source_mask", None) is None:
+            self._source_mask = self._mask
+
     # TODO: flesh this out in full (with tests)
     def clip_mask(self, geometry: gpd.GeoSeries, *, all_touched: bool = True) -> None:
         """clip mask to target region(s)"""
         if self.mask is not None:
+            self._keep_source_mask()
             self._mask.rio.write_crs("epsg:4326", inplace=True)
             self._mask = self._mask.rio.clip(
                 geometry, all_touched=all_touched, drop=False
@@ -63,6 +79,7 @@ class SoilDataset(ABC):
 
         half_res = (self.data.coords["lon"][1] - self.data.coords["lon"][0]) * 0.5
         if self.mask is not None:
+            self._keep_source_mask()
             self._mask.rio.write_crs("epsg:4326", inplace=True)
             self._mask = self._mask.rio.clip_box(
                 minx=minx,
@@ -73,6 +90,24 @@ class SoilDataset(ABC):
         else:
             raise NotImplementedError("This is invalid!")
 
+    def clip_mask_cells(self, keep: np.ndarray) -> None:
+        """clip mask to the cells flagged in keep (boolean array of the source grid)"""
+        self._keep_source_mask()
+        source = self.source_mask.transpose("lat", "lon")
+        keep = xr.DataArray(keep, coords=source.coords, dims=source.dims)
+        self._mask = self._mask.where(keep.sel(lat=self._mask.lat, lon=self._mask.lon))
+
+    def select_cells(self, j: np.ndarray, i: np.ndarray) -> None:
+        """restrict mask to the given cells (indices of the source grid)"""
+        self._keep_source_mask()
+        source = self.source_mask.transpose("lat", "lon")
+
+        keep = np.zeros(source.shape, dtype=bool)
+        keep[j, i] = True
+        self._mask = source.where(keep).isel(
+            lat=slice(j.min(), j.max() + 1), lon=slice(i.min(), i.max() + 1)
+        )
+
     @property
     def mask(self) -> Union[xr.DataArray, None]:
         """return binary mask"""
@@ -104,6 +139,19 @@ class SoilDataset(ABC):
         mask_3d = mask_3d.where(mask_3d == 1)
         return mask_3d
 
+    @property
+    def source_mask(self) -> xr.DataArray:
+        """return layer mask of the source data (ignoring any clipping)"""
+        source_mask = getattr(self, "_source_mask", None)
+        return source_mask if source_mask is not None else self._mask
+
+    @property
+    def cell_index(self) -> NearestCellIndex:
+        """return nearest valid cell index of the source data (built once)"""
+        if getattr(self, "_cell_index", None) is None:
+            self._cell_index = NearestCellIndex(self.source_mask.notnull())
+        return self._cell_index
+
     @property
     def layer_mask(self) -> xr.DataArray:
         """return mask with indicators for number of layers"""
@@ -0,0 +1,72 @@
+from typing import Optional
+
+import numpy as np
+import xarray as xr
+
+from ldndctools.sources.soil.soil_iscricwise import ISRICWISE_SoilDataset
+
+__all__ = ["COMPOSITE_SoilDataset"]
+
+# provenance codes of the SOURCE variable
+SOURCE_NONE = 0
+SOURCE_PRIMARY = 1
+SOURCE_FALLBACK = 2
+
+
+class COMPOSITE_SoilDataset(ISRICWISE_SoilDataset):
+    """primary (i.e. national) soil data where valid, fallback (ISRIC-WISE) elsewhere
+
+    The primary data is aligned to the fallback grid and both are merged cell by
+    cell in a single where pass. The SOURCE variable records the provenance.
+    """
+
+    def __init__(
+        self,
+        primary: xr.Dataset,
+        fallback: xr.Dataset,
+        *,
+        zdim: Optional[str] = "lev",
+        names: tuple = ("national", "isricwise"),
+    ):
+        self._zdim = zdim
+        self._names = names
+
+        fallback = self._calculate_missing_vars(fallback)
+        primary = self._calculate_missing_vars(self._align(primary, fallback))
+
+        common = [v for v in fallback.data_vars if v in primary.data_vars]
+        use_primary = self._build_mask(primary).notnull()
+
+        soil = primary[common].where(use_primary, fallback[common])
+
+        self._mask = self._build_mask(soil)
+        soil["SOURCE"] = self._provenance(use_primary, self._mask.notnull())
+        self._soil = soil
+
+    @staticmethod
+    def _align(primary: xr.Dataset, fallback: xr.Dataset) -> xr.Dataset:
+        """put primary data on the fallback grid (tolerates float noise in coords)"""
+        tolerance = float(abs(fallback.lon[1] - fallback.lon[0])) * 0.5
+        return primary.reindex(
+            lat=fallback.lat, lon=fallback.lon, method="nearest", tolerance=tolerance
+        )
+
+    def _provenance(
+        self, use_primary: xr.DataArray, valid: xr.DataArray
+    ) -> xr.DataArray:
+        source = xr.where(
+            use_primary,
+            SOURCE_PRIMARY,
+            xr.where(valid, SOURCE_FALLBACK, SOURCE_NONE),
+        ).astype(np.int8)
+        source.attrs = {
+            "long_name": "source of soil data",
+            "flag_values": [SOURCE_NONE, SOURCE_PRIMARY, SOURCE_FALLBACK],
+            "flag_meanings": " ".join(("none",) + tuple(self._names)),
+        }
+        return source
+
+    @property
+    def provenance(self) -> xr.DataArray:
+        """source of each (masked) cell: 1 primary, 2 fallback, 0 no data"""
+        return self._soil["SOURCE"].sel(lat=self._mask.lat, lon=self._mask.lon)
@@ -0,0 +1,122 @@
+"""tiled (lat/lon chunked) zarr stores of the global soil grids
+
+The global soil files are monolithic NetCDF files. Converted to a consolidated
+zarr store with square lat/lon tiles, a regional request only has to fetch the
+tiles that cover the selection.
+"""
+import argparse
+import logging
+from typing import Any, Dict, Optional
+
+import numpy as np
+import xarray as xr
+
+from ldndctools.misc.types import BoundingBox
+
+__all__ = ["tile_chunks", "write_tiled_store", "open_tiled_store", "select_tiles"]
+
+log = logging.getLogger(__name__)
+
+# tile edge length in degrees
+DEFAULT_TILE_SIZE = 5.0
+
+
+def _resolution(coord: xr.DataArray) -> float:
+    """regular grid spacing of a 1d coordinate"""
+    return float(abs(coord.values[1] - coord.values[0]))
+
+
+def tile_chunks(
+    ds: xr.Dataset, *, tile_size: float = DEFAULT_TILE_SIZE, zdim: str = "lev"
+) -> Dict[str, int]:
+    """number of grid cells per tile for each dimension (full column for zdim)"""
+    chunks = {}
+    for dim in ["lat", "lon"]:
+        ncells = max(1, int(round(tile_size / _resolution(ds[dim]))))
+        chunks[dim] = min(ncells, ds.sizes[dim])
+    if zdim in ds.dims:
+        chunks[zdim] = ds.sizes[zdim]
+    return chunks
+
+
+def write_tiled_store(
+    ds: xr.Dataset,
+    store: Any,
+    *,
+    tile_size: float = DEFAULT_TILE_SIZE,
+    zdim: str = "lev",
+    storage_options: Optional[Dict[str, Any]] = None,
+) -> None:
+    """write soil dataset to a consolidated zarr store chunked in lat/lon tiles"""
+    chunks = tile_chunks(ds, tile_size=tile_size, zdim=zdim)
+
+    ds = ds.copy()
+    for var in ds.variables:
+        # netcdf encodings (chunksizes, zlib, ...) do not translate to zarr
+        ds[var].encoding = {}
+
+    ds.attrs["tile_size"] = tile_size
+    ds.chunk(chunks).to_zarr(
+        store, mode="w", consolidated=True, storage_options=storage_options
+    )
+    log.info(f"Wrote tiled soil store with chunks {chunks}")
+
+
+def select_tiles(ds: xr.Dataset, bbox: Optional[BoundingBox] = None) -> xr.Dataset:
+    """lazily subset a tiled dataset to all cells touching the bounding box"""
+    if bbox is None:
+        return ds
+
+    def overlaps(coord: xr.DataArray, vmin: float, vmax: float) -> slice:
+        # cells that share more than an edge with [vmin, vmax]; contiguous on a
+        # monotonic axis, so a plain slice keeps the lazy graph a chunk slice
+        half = _resolution(coord) * 0.5
+        tol = half * 1e-3
+        values = coord.values
+        idx = np.flatnonzero(
+            (values + half > vmin + tol) & (values - half < vmax - tol)
+        )
+        return slice(idx[0], idx[-1] + 1) if len(idx) else slice(0, 0)
+
+    return ds.isel(
+        lat=overlaps(ds["lat"], bbox.y1, bbox.y2),
+        lon=overlaps(ds["lon"], bbox.x1, bbox.x2),
+    )
+
+
+def open_tiled_store(
+    store: Any,
+    *,
+    bbox: Optional[BoundingBox] = None,
+    storage_options: Optional[Dict[str, Any]] = None,
+) -> xr.Dataset:
+    """open a tiled soil store, only the tiles covering bbox are read on load"""
+    ds = xr.open_zarr(store, consolidated=True, storage_options=storage_options)
+    return select_tiles(ds, bbox)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert a global soil NetCDF file into a tiled zarr store"
+    )
+    parser.add_argument("infile", help="soil netcdf file")
+    parser.add_argument("outstore", help="target zarr store (path or url)")
+    parser.add_argument(
+        "-t",
+        "--tile-size",
+        dest="tile_size",
+        default=DEFAULT_TILE_SIZE,
+        type=float,
+        help=f"tile edge length in degrees (default: {DEFAULT_TILE_SIZE})",
+    )
+    args = parser.parse_args()
+
+    if not 0 < args.tile_size <= 180:
+        parser.error("tile size must be in (0, 180]")
+
+    with xr.open_dataset(args.infile) as ds:
+        write_tiled_store(ds, args.outstore, tile_size=args.tile_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -61,6 +61,8 @@ setup(
             "dlsc=ldndctools.dlsc:main",
             "cdgen=ldndctools.cdgen:main",
             "nlcc_split4db=ldndctools.nlcc_split4db:main",
+            "soil2zarr=ldndctools.sources.soil.tiles:main",
+            "soil_pyramid=ldndctools.sources.soil.pyramid:main",
         ]
     },
     dependency_links=dependency_links,
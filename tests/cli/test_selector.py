@@ -0,0 +1,144 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+
+from ldndctools.cli.selector import (
+    CoordinateSelection,
+    list_countries_in_domain,
+    Selector,
+)
+from ldndctools.misc.types import BoundingBox
+
+
+def test_selector_lookups(country_gdf):
+    selector = Selector(country_gdf)
+
+    assert list(selector.countries) == sorted(country_gdf.ADM0_A3)
+    assert selector.countries["DEU"] == "Germany"
+    assert selector.selected == selector.countries
+    assert selector.continents["Europe"] == selector.countries
+    assert set(selector.regions["Western Europe"]) == {
+        "AUT",
+        "BEL",
+        "CHE",
+        "DEU",
+        "FRA",
+        "LIE",
+        "LUX",
+        "NLD",
+    }
+    assert list(selector.regions) == sorted(selector.regions)
+    # only countries present in the admin layer
+    assert "ITA" not in selector.regions["EU27"]
+    assert "CHE" in selector.regions["EU28PLUS"]
+
+
+def test_selector_set_region(country_gdf):
+    selector = Selector(country_gdf)
+    selector.set_region(["Northern Europe", "LUX"])
+    assert selector.selected == {"DNK": "Denmark", "LUX": "Luxembourg"}
+    # the lookups are not affected by the selection
+    assert len(selector.countries) == len(country_gdf)
+
+
+def test_list_countries_in_domain_duplicate_codes(country_gdf):
+    df = gpd.GeoDataFrame(pd.concat([country_gdf, country_gdf.iloc[[1]]]))
+    data = list_countries_in_domain(df, domain="SUBREGION")
+    assert data["Western Europe"]["DEU"] == "Germany"
+
+
+def test_selector_gdf_mask_memoized(country_gdf, monkeypatch):
+    calls = []
+    dissolve = gpd.GeoDataFrame.dissolve
+
+    def counting_dissolve(self, *args, **kwargs):
+        calls.append(1)
+        return dissolve(self, *args, **kwargs)
+
+    monkeypatch.setattr(gpd.GeoDataFrame, "dissolve", counting_dissolve)
+
+    selector = Selector(country_gdf)
+    selector.set_region(["DEU", "AUT"])
+    mask = selector.gdf_mask
+    assert selector.gdf_mask is mask
+    assert len(calls) == 1
+
+    # same selection and bbox: memo is kept
+    selector.set_region(["AUT", "DEU"])
+    selector.set_bbox(BoundingBox())
+    assert selector.gdf_mask is mask
+
+    # new bbox: clipped again, but not dissolved again
+    selector.set_bbox(BoundingBox(x1=10, y1=47, x2=12, y2=50))
+    clipped = selector.gdf_mask
+    assert clipped.total_bounds.tolist() == [10, 47, 12, 50]
+    assert len(calls) == 1
+
+    selector.set_region(["DEU"])
+    assert selector.gdf_mask is not clipped
+    assert len(calls) == 2
+
+    # selection outside of bbox
+    selector.set_bbox(BoundingBox(x1=-10, y1=0, x2=-5, y2=5))
+    assert selector.gdf_mask is None
+
+
+def test_selector_locate(country_gdf):
+    selector = Selector(country_gdf)
+    codes = selector.locate(
+        [52.52, 48.86, 46.95, 40.42, 50.85], [13.40, 2.35, 7.45, 3.70, 4.35]
+    )
+    assert codes.tolist() == ["DEU", "FRA", "CHE", None, "BEL"]
+
+    # bulk lookup
+    rng = np.random.default_rng(0)
+    lats, lons = rng.uniform(44, 56, 10000), rng.uniform(-5, 18, 10000)
+    codes = selector.locate(lats, lons)
+    inside = country_gdf[country_gdf.ADM0_A3 == "AUT"].geometry.iloc[0]
+    expected = shapely.intersects(inside, shapely.points(lons, lats))
+    np.testing.assert_array_equal(codes == "AUT", expected)
+
+
+def test_coordinate_selection_select():
+    selector = CoordinateSelection(lon=8.5, lat=50.1, cid=7)
+    selector.select(np.array([False]))
+    assert len(selector) == 0
+    assert selector.bbox is None
+
+
+def test_coordinate_selection_bbox():
+    selector = CoordinateSelection(lon=179.5, lat=50.1, cid=7)
+    bbox = selector.bbox
+    assert (bbox.x1, bbox.x2) == (178.5, 180)
+    assert bbox.y1 == pytest.approx(49.1) and bbox.y2 == pytest.approx(51.1)
+
+
+def test_selector_region_geometries(country_gdf, tmp_path):
+    selector = Selector(country_gdf, cache_dir=tmp_path)
+    selector.set_region(["Western Europe"])
+
+    dissolved = selector.gdf_dissolved
+    expected = selector.gdf.dissolve()
+    assert dissolved.geometry.iloc[0].equals(expected.geometry.iloc[0])
+    assert len(list(tmp_path.glob("regions_*.parquet"))) == 2
+
+    display = selector.gdf_display
+    assert shapely.get_num_coordinates(
+        display.geometry.iloc[0]
+    ) < shapely.get_num_coordinates(dissolved.geometry.iloc[0])
+
+    # no region matches
+    selector.set_region(["DEU"])
+    assert selector.gdf_display is selector.gdf_mask
+
+
+def test_selector_admin_index(country_gdf, isricwise_ds, tmp_path):
+    selector = Selector(country_gdf, cache_dir=tmp_path)
+    grid = isricwise_ds.source_mask
+    index = selector.admin_index(grid)
+
+    assert index.shape == grid.shape
+    assert index.mask(["DEU"]).sum() > 0
+    assert len(list(tmp_path.glob("admin_index_*.npz"))) == 1
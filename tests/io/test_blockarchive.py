@@ -0,0 +1,89 @@
+import gzip
+
+import pytest
+
+from ldndctools.io.blockarchive import (
+    BlockArchiveWriter,
+    index_path,
+    open_index,
+    read_index,
+    read_member,
+)
+
+
+@pytest.mark.parametrize("threads", [1, 3])
+def test_block_gzip_archive(tmp_path, threads):
+    path = tmp_path / "a.txt.gz"
+    with BlockArchiveWriter(path, threads=threads) as archive:
+        archive.add(b"header\n")
+        archive.add(b"site one\n", key="1")
+        archive.add(b"site two\n" * 1000, key="2")
+        with pytest.raises(ValueError):
+            archive.add(b"again", key="1")
+        archive.add(b"unindexed\n")
+
+    # a valid (multi-member) gzip file
+    with gzip.open(path) as f:
+        text = f.read()
+    assert text == b"header\nsite one\n" + b"site two\n" * 1000 + b"unindexed\n"
+
+    index = read_index(path)
+    assert list(index) == ["1", "2"] and index == archive.index
+    assert index_path(path).name == "a.txt.gz.idx"
+    assert read_member(index["2"]) == b"site two\n" * 1000
+    assert read_member(index["1"]) == b"site one\n"
+
+
+@pytest.mark.parametrize("threads", [1, 3])
+def test_failed_archive_is_removed(tmp_path, threads):
+    path = tmp_path / "a.txt.gz"
+    with BlockArchiveWriter(path) as archive:
+        archive.add(b"site one\n", key="1")
+    assert index_path(path).is_file()
+
+    # rewritten, but the writer fails: no partial archive, no stale index
+    with pytest.raises(RuntimeError):
+        with BlockArchiveWriter(path, threads=threads) as archive:
+            for n in range(10):
+                archive.add(b"site\n" * 100, key=str(n))
+            raise RuntimeError
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_open_index(tmp_path):
+    for name, keys in [("a.gz", ["1", "2"]), ("b.gz", ["3"])]:
+        with BlockArchiveWriter(tmp_path / name) as archive:
+            for key in keys:
+                archive.add(key.encode(), key=key)
+    (tmp_path / "other.gz").write_bytes(gzip.compress(b"no index"))
+
+    index = open_index(tmp_path)
+    assert {k: v.path.name for k, v in index.items()} == {
+        "1": "a.gz",
+        "2": "a.gz",
+        "3": "b.gz",
+    }
+    assert read_member(index["3"]) == b"3"
+
+    with BlockArchiveWriter(tmp_path / "c.gz") as archive:
+        archive.add(b"", key="2")
+    with pytest.raises(ValueError):
+        open_index(tmp_path)
+
+
+def test_zstd_archive(tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    path = tmp_path / "a.txt.zst"
+    with BlockArchiveWriter(path, codec="zstd", threads=2) as archive:
+        for key in "abc":
+            archive.add(key.encode() * 100, key=key)
+
+    with open(path, "rb") as f:
+        reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+        assert reader.read() == b"a" * 100 + b"b" * 100 + b"c" * 100
+    assert read_member(read_index(path)["b"]) == b"b" * 100
+
+
+def test_unknown_codec(tmp_path):
+    with pytest.raises(ValueError):
+        BlockArchiveWriter(tmp_path / "a.txt.xz", codec="xz")
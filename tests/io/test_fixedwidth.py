@@ -0,0 +1,65 @@
+import io
+
+import numpy as np
+import pytest
+
+from ldndctools.cdgen import DATA_FORMAT
+from ldndctools.io.fixedwidth import FieldSpec, format_fixed, parse_format
+
+
+def savetxt(values, fmt):
+    buffer = io.StringIO()
+    np.savetxt(buffer, values, fmt=fmt)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def climate_block():
+    rng = np.random.default_rng(42)
+    n = 5000
+    days = np.arange(n)
+    columns = [1990 + days // 365, days % 365 + 1]
+    columns += [rng.normal(5, 15, n).astype(np.float32) for _ in range(7)]
+    return np.column_stack(columns).astype(np.float64)
+
+
+def test_parse_format():
+    assert parse_format("%-8.0f%8.2f") == [
+        FieldSpec(8, 0, True),
+        FieldSpec(8, 2, False),
+    ]
+    for fmt in ["%d", "%-8.2f %-8.2f", "%s", ""]:
+        with pytest.raises(ValueError):
+            parse_format(fmt)
+
+
+def test_format_fixed_matches_savetxt(climate_block):
+    assert format_fixed(climate_block, DATA_FORMAT) == savetxt(
+        climate_block, DATA_FORMAT
+    )
+
+
+@pytest.mark.parametrize(
+    "value",
+    [0.0, -0.0, -0.004, 0.005, 0.125, 0.375, 2.675, 1.005, -1.005, 99999.994,
+     99999.995, 12345678.9, -1234567.8, 1e20, np.nan, np.inf, -np.inf, 1e-300],
+)  # fmt: skip
+@pytest.mark.parametrize("fmt", ["%-8.2f", "%8.2f", "%-8.0f", "%-3.1f", "%5.3f"])
+def test_format_fixed_edge_cases(value, fmt):
+    values = np.full((3, 1), value)
+    assert format_fixed(values, fmt) == savetxt(values, fmt)
+
+
+def test_format_fixed_rounding_ties():
+    # values with exactly three decimals are close to (or on) rounding ties
+    rng = np.random.default_rng(0)
+    values = np.round(rng.normal(0, 50, (20000, 2)), 3)
+    fmt = "%-8.2f%8.2f"
+    assert format_fixed(values, fmt) == savetxt(values, fmt)
+
+
+def test_format_fixed_shapes():
+    assert format_fixed(np.empty((0, 2)), "%-8.2f%-8.2f") == ""
+    assert format_fixed(np.array([1.5, 2.5]), "%-4.1f") == "1.5 \n2.5 \n"
+    with pytest.raises(ValueError):
+        format_fixed(np.ones((2, 3)), "%-8.2f%-8.2f")
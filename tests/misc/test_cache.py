@@ -0,0 +1,19 @@
+import pytest
+
+from ldndctools.misc.cache import atomic_path
+
+
+def test_atomic_path(tmp_path):
+    path = tmp_path / "data.npz"
+    with atomic_path(path) as tmp:
+        assert tmp.parent == tmp_path and tmp.suffix == ".npz"
+        tmp.write_text("new")
+    assert path.read_text() == "new"
+
+    # a failing writer leaves neither a partial nor a temporary file
+    with pytest.raises(RuntimeError):
+        with atomic_path(path) as tmp:
+            tmp.write_text("partial")
+            raise RuntimeError
+    assert path.read_text() == "new"
+    assert [p.name for p in tmp_path.iterdir()] == ["data.npz"]
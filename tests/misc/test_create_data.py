@@ -0,0 +1,101 @@
+import os
+import re
+import time
+import xml.etree.ElementTree as et
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from ldndctools.cli.selector import CoordinateSelection, Selector
+from ldndctools.misc.create_data import create_dataset
+from ldndctools.misc.types import BoundingBox, RES
+from ldndctools.sources.soil.soil_iscricwise import ISRICWISE_SoilDataset
+
+# generous budget (s) for a site file with SCALE_SITES coordinates (~2s locally)
+SCALE_BUDGET = 20
+SCALE_SITES = 100_000
+
+
+@pytest.fixture
+def soil():
+    path = os.path.join(os.path.dirname(__file__), "../data/ISRICWISE_DE_LR.nc")
+    return ISRICWISE_SoilDataset(xr.open_dataset(path).load())
+
+
+@pytest.fixture
+def coordinate_file(tmp_path):
+    path = tmp_path / "sites.txt"
+    path.write_text(
+        "ID lat lon\n"
+        "101 50.30 8.60\n"
+        "102 50.20 8.70\n"  # same cell as 101
+        "103 48.10 11.55\n"
+        "104 52.40 13.10\n"
+        "105 0.00 -30.00\n"  # no soil data nearby
+    )
+    return path
+
+
+def test_coordinate_selection_reads_file(coordinate_file):
+    selector = CoordinateSelection(coordinate_file)
+    assert len(selector) == 5
+    np.testing.assert_array_equal(selector.ids, [101, 102, 103, 104, 105])
+
+
+def test_create_dataset_coordinate_selection(soil, coordinate_file, caplog):
+    selector = CoordinateSelection(coordinate_file)
+    xml, nc = create_dataset(soil, selector, RES.LR, {})
+
+    # every id gets a site, coordinates sharing a cell share its data
+    sites = et.fromstring(xml).findall("site")
+    assert [s.get("id") for s in sites] == ["101", "102", "103", "104"]
+    coords = [(float(s.get("lat")), float(s.get("lon"))) for s in sites]
+    np.testing.assert_allclose(
+        coords, [(50.25, 8.75), (50.25, 8.75), (48.25, 11.75), (52.25, 13.25)]
+    )
+    assert et.tostring(sites[0].find("soil")) == et.tostring(sites[1].find("soil"))
+    assert all(len(s.findall("./soil/layers/layer")) > 0 for s in sites)
+    assert "skipped ids: 105" in caplog.text
+
+    assert int(nc.soilmask.sum()) == 3
+    assert sorted(np.unique(nc.siteid.fillna(0))) == [0, 101, 103, 104]
+
+
+def test_create_dataset_coordinate_selection_snaps_to_near_cells(soil, tmp_path):
+    # far from any valid cell (open sea), the old 10° search found a cell
+    path = tmp_path / "sites.txt"
+    path.write_text("ID lat lon\n201 50.30 8.60\n202 57.50 1.00\n")
+    xml, _ = create_dataset(soil, CoordinateSelection(path), RES.LR, {})
+    assert [s.get("id") for s in et.fromstring(xml).findall("site")] == ["201"]
+
+
+def test_create_dataset_country_selection(soil, country_gdf, tmp_path, monkeypatch):
+    monkeypatch.setenv("LDNDCTOOLS_CACHE", str(tmp_path))
+    selector = Selector(country_gdf)
+    selector.set_region(["DNK"])
+    selector.set_bbox(BoundingBox(x1=5, y1=47, x2=16, y2=55))
+    xml, nc = create_dataset(soil, selector, RES.LR, {})
+
+    assert len(et.fromstring(xml).findall("site")) == int(nc.soilmask.sum()) == 2
+    assert float(nc.lat.where(nc.soilmask > 0).min()) > 54
+    assert len(list(tmp_path.glob("admin_index_*.npz"))) == 1
+
+
+def test_create_dataset_coordinate_selection_scales(soil, tmp_path):
+    rng = np.random.default_rng(42)
+    lats = rng.uniform(47.5, 54.5, SCALE_SITES)
+    lons = rng.uniform(6.0, 15.0, SCALE_SITES)
+    path = tmp_path / "sites.txt"
+    lines = [f"{i} {lat:.4f} {lon:.4f}" for i, (lat, lon) in enumerate(zip(lats, lons))]
+    path.write_text("\n".join(["ID lat lon"] + lines) + "\n")
+    selector = CoordinateSelection(path)
+
+    start = time.perf_counter()
+    xml, _ = create_dataset(soil, selector, RES.LR, {})
+    assert time.perf_counter() - start < SCALE_BUDGET
+
+    # parsing the whole document takes longer than writing it
+    ids = [int(i) for i in re.findall(r'<site id="(\d+)"', xml)]
+    assert len(ids) > 0.9 * SCALE_SITES
+    assert ids == sorted(ids)
@@ -0,0 +1,40 @@
+import numpy as np
+
+from ldndctools.misc.geohash import (
+    cells_bbox,
+    common_prefix,
+    coords2geohash_dec,
+    dec2cells,
+    decoder,
+    encoder,
+    hash2dec,
+)
+
+
+def test_dec2cells():
+    lats, lons = np.meshgrid([-60.2, 0.0, 48.1], [-120.5, 0.0, 11.6])
+    for pre in (1, 2, 3):
+        hashes = [hash2dec(encoder(a, b, pre)) for a, b in zip(lats.flat, lons.flat)]
+        lat, lon = dec2cells(np.array(hashes), pre)
+        nlat, nlon = (5 * pre) // 2, (5 * pre + 1) // 2
+        np.testing.assert_array_equal(lat, ((lats.ravel() + 90) / 180 * 2**nlat) // 1)
+        np.testing.assert_array_equal(lon, ((lons.ravel() + 180) / 360 * 2**nlon) // 1)
+
+
+def test_common_prefix():
+    a = coords2geohash_dec(lat=48.1, lon=11.6)
+    b = coords2geohash_dec(lat=48.2, lon=11.6)
+    assert common_prefix(a, b) == "u28"
+    assert common_prefix(a, a) == encoder(48.1, 11.6, 6)
+    assert common_prefix(a, coords2geohash_dec(lat=-10.0, lon=11.6)) == ""
+
+
+def test_cells_bbox():
+    a = coords2geohash_dec(lat=48.1, lon=11.6)
+    b = coords2geohash_dec(lat=-10.0, lon=12.5)
+    (y1, y2), (x1, x2) = decoder(encoder(48.1, 11.6, 6))
+    assert cells_bbox(np.array([a])) == (x1, y1, x2, y2)
+
+    x1, y1, x2, y2 = cells_bbox(np.array([a, b]))
+    assert 11.5 < x1 < 11.6 and 12.5 < x2 < 12.6
+    assert -10.1 < y1 < -10.0 and 48.1 < y2 < 48.2
@@ -0,0 +1,118 @@
+import os
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from ldndctools.misc.spatial import (
+    align_to_grid,
+    grid_index,
+    NearestCellIndex,
+    snap_to_grid,
+)
+from ldndctools.sources.soil.soil_iscricwise import ISRICWISE_SoilDataset
+
+
+@pytest.fixture
+def valid():
+    lat = np.arange(-89.75, 90, 0.5)
+    lon = np.arange(-179.75, 180, 0.5)
+    da = xr.DataArray(
+        np.zeros((len(lat), len(lon)), dtype=bool),
+        coords=[("lat", lat), ("lon", lon)],
+    )
+    da.loc[dict(lat=47.25, lon=11.25)] = True
+    da.loc[dict(lat=-10.25, lon=179.75)] = True
+    return da
+
+
+def test_nearest_cell_index_single_point(valid):
+    index = NearestCellIndex(valid)
+    assert len(index) == 2 and index.spacing == pytest.approx(0.5)
+
+    j, i, dist = index.query(50.0, 8.0)
+    assert index.lat[j[0]] == 47.25 and index.lon[i[0]] == 11.25
+    assert 3.0 < dist[0] < 4.5
+
+
+def test_nearest_cell_index_wraps_dateline(valid):
+    index = NearestCellIndex(valid)
+    j, i, _ = index.query(-10.0, -179.9)
+    assert index.lat[j[0]] == -10.25 and index.lon[i[0]] == 179.75
+
+
+def test_nearest_cell_index_max_distance(valid):
+    index = NearestCellIndex(valid)
+    j, i, dist = index.query([47.0, 0.0], [11.0, 0.0], max_distance=10.0)
+    np.testing.assert_array_equal(j >= 0, [True, False])
+    np.testing.assert_array_equal(i >= 0, [True, False])
+    assert np.isinf(dist[1])
+
+
+def test_nearest_cell_index_bulk_query(valid):
+    index = NearestCellIndex(valid)
+    rng = np.random.default_rng(42)
+    lats = rng.uniform(40, 55, 100_000)
+    lons = rng.uniform(0, 20, 100_000)
+
+    j, i, _ = index.query(lats, lons)
+    assert (index.lat[j] == 47.25).all() and (index.lon[i] == 11.25).all()
+
+
+def test_soil_cell_index_ignores_clipping():
+    path = os.path.join(os.path.dirname(__file__), "../data/ISRICWISE_DE_LR.nc")
+    isricwise_ds = ISRICWISE_SoilDataset(xr.open_dataset(path).load())
+
+    n_valid = int(isricwise_ds.layer_mask.notnull().sum())
+    isricwise_ds.clip_mask_box(minx=10, miny=50, maxx=11, maxy=51)
+
+    index = isricwise_ds.cell_index
+    assert len(index) == n_valid
+
+    # nearest valid cell of an invalid (masked) cell is not the cell itself
+    invalid = isricwise_ds.source_mask.isnull()
+    lat = invalid.lat.where(invalid).max().item()
+    lon = invalid.lon.where(invalid.sel(lat=lat)).dropna("lon")[0].item()
+    j, i, dist = index.query(lat, lon)
+    assert dist[0] > 0
+    assert not np.isnan(isricwise_ds.source_mask.values[j[0], i[0]])
+
+
+def test_snap_to_grid():
+    coord = np.array([0.25, 0.75, 1.25, 1.75])
+    np.testing.assert_array_equal(
+        snap_to_grid(coord, [-3.0, 0.3, 0.6, 1.0, 1.76, 9.0]), [0, 0, 1, 1, 3, 3]
+    )
+    np.testing.assert_array_equal(
+        snap_to_grid(coord[::-1], [-3.0, 0.3, 0.6, 1.76]), [3, 3, 2, 0]
+    )
+
+
+def test_grid_index():
+    coord = np.array([0.25, 0.75, 1.25, 1.75])
+    np.testing.assert_array_equal(
+        grid_index(coord, [0.25 + 1e-9, 0.7, 1.75, 2.0], 1e-6), [0, -1, 3, -1]
+    )
+
+
+def test_align_to_grid():
+    mask = xr.DataArray(
+        [[0.0, 1.0], [1.0, np.nan]],
+        dims=("lon", "lat"),
+        coords={"lat": [50.0, 51.0], "lon": [8.0, 9.0]},
+    )
+    # finer grid, slightly off (float noise), larger than the mask
+    lat = np.array([49.75, 50.25, 50.75, 51.25, 51.75]) + 1e-7
+    lon = np.array([8.0, 8.5, 9.0 - 1e-7])
+    aligned = align_to_grid(mask, lat, lon)
+    assert aligned.dims == ("lat", "lon")
+    np.testing.assert_array_equal(aligned.lat, lat)
+    expected = [[0, 0, 1], [0, 0, 1], [1, 1, np.nan], [1, 1, np.nan]]
+    np.testing.assert_array_equal(aligned.values[:4], expected)
+    assert np.isnan(aligned.values[4]).all()  # outside the mask grid
+    # binary values stay binary
+    assert set(np.unique(aligned.values[~np.isnan(aligned.values)])) == {0, 1}
+
+    # same grid (up to float noise)
+    exact = align_to_grid(mask, [50.0 + 1e-7, 51.0], lon, tolerance=1e-6)
+    np.testing.assert_array_equal(exact.values, [[0, np.nan, 1], [1, np.nan, np.nan]])
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from ldndctools.sources.climate.layout import (
+    is_time_major,
+    time_major_chunks,
+    to_time_major,
+)
+
+
+@pytest.fixture
+def climate():
+    rng = np.random.default_rng(2)
+    time = pd.date_range("2001-01-01", periods=1000, freq="D")
+    ds = xr.Dataset(
+        {
+            v: (("time", "lat", "lon"), rng.normal(10, 5, (len(time), 12, 20)))
+            for v in ["tavg", "prec"]
+        },
+        coords={"time": time, "lat": np.arange(12) * 0.1, "lon": np.arange(20) * 0.1},
+    ).astype(np.float32)
+    # map layout: few time steps, large spatial chunks
+    return ds.chunk({"time": 10, "lat": 6, "lon": 10})
+
+
+def test_time_major_chunks(climate):
+    # copy regions span a common multiple of source chunk (6, 10) and tile
+    copy, chunks = time_major_chunks(climate, tile=4, max_mem=80 * 12 * 20 * 4)
+    assert copy == (80, 12, 20) and chunks == (80, 4, 4)
+    copy, chunks = time_major_chunks(climate, tile=3, max_mem=2**30)
+    assert copy == (1000, 6, 20) and chunks == (1000, 3, 3)
+
+    # whole time axis if memory allows
+    copy, chunks = time_major_chunks(climate, tile=4, max_mem=2**30)
+    assert copy == (1000, 12, 20) and chunks == (1000, 4, 4)
+
+    # source chunks too large for the memory are split
+    copy, chunks = time_major_chunks(climate, tile=2, max_mem=10 * 4 * 4 * 4)
+    assert copy == (20, 2, 4) and chunks == (20, 2, 2)
+
+
+def test_to_time_major(climate, tmp_path):
+    store = tmp_path / "climate.zarr"
+    shapes = to_time_major(climate, store, tile=4, max_mem=2**20)
+    assert shapes["chunks"] == (1000, 4, 4)
+
+    ds = xr.open_zarr(store)
+    assert is_time_major(ds) and not is_time_major(climate)
+    assert ds.tavg.encoding["chunks"] == (1000, 4, 4)
+    assert ds.tavg.chunks[1:] == ((4, 4, 4), (4, 4, 4, 4, 4))
+    xr.testing.assert_identical(ds.load(), climate.load().assign_attrs(ds.attrs))
+    # survives subsetting
+    assert is_time_major(ds.sel(lat=slice(0.2, 0.5), time=slice("2002", None)))
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from ldndctools.sources.climate.stats import site_stats, STATS
+
+
+@pytest.fixture
+def climate():
+    rng = np.random.default_rng(1)
+    time = pd.date_range("2001-01-01", "2004-12-31", freq="D")
+    shape = (len(time), 4, 5)
+    ds = xr.Dataset(
+        {
+            v: (("time", "lat", "lon"), rng.normal(10, 5, shape))
+            for v in ["tavg", "prec", "wind"]
+        },
+        coords={"time": time, "lat": np.arange(4) * 0.1, "lon": np.arange(5) * 0.1},
+    )
+    ds["tavg"][:, 0, 0] = np.nan
+    ds["prec"][:, 0, 0] = np.nan
+    ds["tavg"][100:500, 1, 1] = np.nan
+    return ds
+
+
+def reference(ds):
+    def amplitude(da):
+        return (da.max(dim="time") - da.min(dim="time")) / 2
+
+    years = ds.groupby("time.year")
+    return xr.Dataset(
+        {
+            "tavg": years.mean(dim="time").tavg.mean(dim="year"),
+            "tamp": ds.tavg.groupby("time.year").map(amplitude).mean(dim="year"),
+            "prec": years.sum(dim="time").prec.mean(dim="year"),
+            "wind": years.mean(dim="time").wind.mean(dim="year"),
+        }
+    )
+
+
+def stats(ds):
+    values = [ds[v].transpose(..., "time").values for v in ["tavg", "prec", "wind"]]
+    result = site_stats(*values, ds.time.dt.year.values)
+    return xr.Dataset(
+        {name: (("lat", "lon"), result[n]) for n, name in enumerate(STATS)},
+        coords={"lat": ds.lat, "lon": ds.lon},
+    )
+
+
+def test_site_stats_matches_groupby(climate):
+    result = stats(climate)
+    xr.testing.assert_allclose(result, reference(climate).transpose("lat", "lon"))
+    assert np.isnan(result.tavg[0, 0]) and result.prec[0, 0] == 0
+
+
+def test_site_stats_partial_years(climate):
+    subset = climate.sel(time=slice("2001-03-15", "2003-08-01"))
+    xr.testing.assert_allclose(
+        stats(subset), reference(subset).transpose("lat", "lon")
+    )
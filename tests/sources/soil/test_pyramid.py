@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from ldndctools.misc.types import RES
+from ldndctools.sources.soil.pyramid import (
+    block_mode_index,
+    build_pyramid,
+    coarsen_mode,
+    open_derived_soil,
+)
+
+
+@pytest.fixture(scope="module")
+def soil_raw():
+    path = os.path.join(os.path.dirname(__file__), "../../data/ISRICWISE_DE_LR.nc")
+    with xr.open_dataset(path) as ds:
+        return ds.load()
+
+
+def test_block_mode_index():
+    blocks = np.array(
+        [
+            [3, 1, 3, 1, 3],  # mode 3, first at 0
+            [2, 5, 5, 2, 7],  # tie (2, 5): smaller id wins
+            [np.nan, 4, np.nan, np.nan, 0],  # nodata never wins
+            [np.nan, np.nan, -1, 0, np.nan],  # no valid data
+        ]
+    )
+    np.testing.assert_array_equal(block_mode_index(blocks), [0, 0, 1, -1])
+
+
+def test_coarsen_mode_takes_attributes_of_mode_cell():
+    suid = np.array([[1, 1, 2, 2], [1, 2, 2, np.nan], [np.nan] * 4, [np.nan, 7] * 2])
+    attr = suid * 10.0
+    ds = xr.Dataset(
+        {
+            "SUID": (("lat", "lon"), suid),
+            "TopDep": (("lev", "lat", "lon"), np.stack([attr, attr + 1])),
+        },
+        coords={
+            "lev": [1, 2],
+            "lat": [0.5, 1.5, 2.5, 3.5],
+            "lon": [0.5, 1.5, 2.5, 3.5],
+        },
+    )
+
+    coarse = coarsen_mode(ds, 2)
+
+    np.testing.assert_array_equal(coarse.lat, [1.0, 3.0])
+    np.testing.assert_array_equal(coarse.lon, [1.0, 3.0])
+    np.testing.assert_array_equal(coarse.SUID, [[1, 2], [7, 7]])
+    np.testing.assert_array_equal(coarse.TopDep.sel(lev=2), [[11, 21], [71, 71]])
+    assert coarse.TopDep.dims == ("lev", "lat", "lon")
+
+
+def test_coarsen_mode_is_lazy_and_chunked(soil_raw):
+    eager = coarsen_mode(soil_raw, 2)
+    lazy = coarsen_mode(soil_raw.chunk({"lat": 8, "lon": 8}), 2)
+
+    assert lazy.TopDep.chunks is not None
+    xr.testing.assert_allclose(lazy.compute(), eager)
+    assert eager.sizes["lat"] == 8 and eager.sizes["lon"] == 11
+
+
+def test_build_pyramid_custom_factors(soil_raw):
+    levels = build_pyramid(soil_raw, {"R2": 2, "R4": 4})
+    assert set(levels) == {"R2", "R4"}
+    assert levels["R4"].sizes["lat"] == 4
+
+
+def test_open_derived_soil_is_cached(soil_raw, tmp_path):
+    assert open_derived_soil(soil_raw, RES.HR, cache_dir=tmp_path) is soil_raw
+
+    mr = open_derived_soil(soil_raw, RES.MR, checksum="abc", cache_dir=tmp_path)
+    assert [p.name for p in tmp_path.iterdir()] == ["GLOBAL_WISESOIL_S1_MR_abc.nc"]
+    assert mr.sizes["lat"] == 16 // 3
+
+    # a new source version is derived again
+    open_derived_soil(soil_raw, RES.MR, checksum="def", cache_dir=tmp_path)
+    assert len(list(tmp_path.iterdir())) == 2
+
+    # default key: content of the source
+    a = open_derived_soil(soil_raw, RES.LR, cache_dir=tmp_path)
+    b = open_derived_soil(soil_raw.copy(deep=True), RES.LR, cache_dir=tmp_path)
+    xr.testing.assert_identical(a, b)
+    assert len(list(tmp_path.glob("*_LR_*.nc"))) == 1
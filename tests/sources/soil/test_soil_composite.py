@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from ldndctools.sources.soil.soil_composite import COMPOSITE_SoilDataset
+from ldndctools.sources.soil.soil_iscricwise import ISRICWISE_SoilDataset
+
+
+@pytest.fixture(scope="module")
+def soil_raw():
+    path = os.path.join(os.path.dirname(__file__), "../../data/ISRICWISE_DE_LR.nc")
+    with xr.open_dataset(path) as ds:
+        return ds.load()
+
+
+@pytest.fixture(scope="module")
+def national_raw(soil_raw):
+    """regional subset with distinguishable values and a data gap"""
+    ds = soil_raw.sel(lon=slice(9.0, 13.0)).copy(deep=True)
+    ds["PHAQ"] = ds["PHAQ"] + 0.5
+    ds["BULK"][:, :, 0] = np.nan
+    # float noise in coordinates must not break alignment
+    return ds.assign_coords(lon=ds.lon + 1e-6)
+
+
+@pytest.fixture(scope="module")
+def composite(national_raw, soil_raw):
+    return COMPOSITE_SoilDataset(national_raw.copy(), soil_raw.copy())
+
+
+def test_composite_keeps_fallback_grid(composite, soil_raw):
+    assert composite.mask.shape == (16, 22)
+    np.testing.assert_array_equal(composite.original.lon, soil_raw.lon)
+
+
+def test_composite_provenance(composite, soil_raw):
+    source = composite.provenance
+    fallback = ISRICWISE_SoilDataset(soil_raw.copy())
+
+    inside = (source.lon > 9.0) & (source.lon < 13.0)
+    gap = np.isclose(source.lon, 9.25)
+
+    valid = fallback.mask.notnull()
+    assert (source.where(inside & ~gap & valid) == 1).sum() > 0
+    assert ((source == 1) == (inside & ~gap & valid)).all()
+    assert ((source == 2) == ((~inside | gap) & valid)).all()
+    assert ((source == 0) == ~valid).all()
+    assert source.dtype == np.int8
+
+
+def test_composite_values_follow_provenance(composite, soil_raw):
+    source = composite.provenance
+    ph = composite.original["PHAQ"].sel(lev=1)
+    ph_ref = soil_raw["PHAQ"].sel(lev=1)
+
+    np.testing.assert_allclose(ph.where(source == 1), (ph_ref + 0.5).where(source == 1))
+    np.testing.assert_allclose(ph.where(source == 2), ph_ref.where(source == 2))
+
+
+def test_composite_data_excludes_provenance(composite):
+    assert "SOURCE" not in composite.data.data_vars
+    assert "ph" in composite.data.data_vars
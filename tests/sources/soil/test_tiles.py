@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+import pytest
+import xarray as xr
+from xarray.testing import assert_equal
+
+from ldndctools.misc.types import BoundingBox
+from ldndctools.sources.soil.soil_iscricwise import ISRICWISE_SoilDataset
+from ldndctools.sources.soil.tiles import (
+    open_tiled_store,
+    select_tiles,
+    tile_chunks,
+    write_tiled_store,
+)
+
+
+@pytest.fixture(scope="module")
+def soil_raw():
+    path = os.path.join(os.path.dirname(__file__), "../../data/ISRICWISE_DE_LR.nc")
+    with xr.open_dataset(path) as ds:
+        return ds.load()
+
+
+@pytest.fixture(scope="module")
+def tiled_store(soil_raw, tmp_path_factory):
+    store = tmp_path_factory.mktemp("tiles") / "soil_LR.zarr"
+    write_tiled_store(soil_raw, str(store), tile_size=2.0)
+    return str(store)
+
+
+def test_tile_chunks(soil_raw):
+    assert tile_chunks(soil_raw, tile_size=2.0) == {"lat": 4, "lon": 4, "lev": 5}
+    assert tile_chunks(soil_raw, tile_size=5.0) == {"lat": 10, "lon": 10, "lev": 5}
+    # tiles are never larger than the domain
+    assert tile_chunks(soil_raw, tile_size=90.0) == {"lat": 16, "lon": 22, "lev": 5}
+
+
+def test_store_is_chunked_in_tiles(tiled_store):
+    ds = xr.open_zarr(tiled_store, consolidated=True)
+    assert ds["TopDep"].chunks == ((5,), (4, 4, 4, 4), (4, 4, 4, 4, 4, 2))
+
+
+def test_open_tiled_store_only_touches_covering_tiles(tiled_store, soil_raw):
+    bbox = BoundingBox(x1=6.0, x2=7.0, y1=48.0, y2=49.0)
+    ds = open_tiled_store(tiled_store, bbox=bbox)
+
+    # a 1x1 deg box at LR lies within a single 2x2 deg tile
+    assert ds["TopDep"].data.npartitions == 1
+    assert ds.sizes["lat"] == 2 and ds.sizes["lon"] == 2
+
+    expected = soil_raw.sel(lat=slice(48.0, 49.0), lon=slice(6.0, 7.0))
+    assert_equal(ds.load(), expected)
+
+
+def test_select_tiles_descending_lat_and_empty(soil_raw):
+    bbox = BoundingBox(x1=6.0, x2=7.0, y1=48.0, y2=49.0)
+    flipped = soil_raw.isel(lat=slice(None, None, -1))
+    assert_equal(
+        select_tiles(flipped, bbox).sortby("lat"), select_tiles(soil_raw, bbox)
+    )
+
+    outside = select_tiles(soil_raw, BoundingBox(x1=-20, x2=-10, y1=0, y2=10))
+    assert outside.sizes["lat"] == 0 and outside.sizes["lon"] == 0
+
+
+def test_open_tiled_store_without_bbox(tiled_store, soil_raw):
+    assert_equal(open_tiled_store(tiled_store).load(), soil_raw)
+
+
+def test_soildataset_from_tiles(tiled_store, soil_raw):
+    bbox = BoundingBox(x1=8.0, x2=12.0, y1=49.0, y2=52.0)
+    soil = ISRICWISE_SoilDataset.from_tiles(
+        xr.open_zarr(tiled_store, consolidated=True), bbox=bbox
+    )
+    reference = ISRICWISE_SoilDataset(
+        soil_raw.sel(lat=slice(49.0, 52.0), lon=slice(8.0, 12.0)).copy()
+    )
+    assert soil.mask.shape == (6, 8)
+    np.testing.assert_array_equal(soil.layer_mask.values, reference.layer_mask.values)
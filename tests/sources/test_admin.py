@@ -0,0 +1,145 @@
+import os
+
+import numpy as np
+import pytest
+import shapely
+from intake_geopandas import GeoPandasFileSource
+
+from ldndctools.cli.selector import prepare_df_countries
+from ldndctools.sources.admin import (
+    ADMIN_COLUMNS,
+    admin_digest,
+    AdminIndex,
+    dissolve_regions,
+    open_admin_index,
+    read_admin,
+    RegionGeometries,
+)
+
+
+@pytest.fixture
+def countries(country_gdf):
+    return prepare_df_countries(country_gdf)
+
+
+@pytest.fixture
+def grid(isricwise_ds):
+    return isricwise_ds.source_mask
+
+
+def test_admin_index_matches_polygon_clip(countries, grid):
+    grid = grid.rio.write_crs("epsg:4326")
+    index = AdminIndex.build(countries, grid.lat.values, grid.lon.values)
+
+    for codes in [["DEU"], ["FRA", "BEL", "LUX"], ["AUT", "CHE", "LIE"]]:
+        geometry = countries[countries.ADM0_A3.isin(codes)].geometry
+        expected = grid.rio.clip(geometry, all_touched=True, drop=False).notnull()
+        np.testing.assert_array_equal(
+            index.mask(codes) & grid.notnull().values, expected.values
+        )
+
+
+def test_admin_index_grid_orientation(countries, grid):
+    ascending = AdminIndex.build(countries, grid.lat.values, grid.lon.values)
+    descending = AdminIndex.build(countries, grid.lat.values[::-1], grid.lon.values)
+
+    np.testing.assert_array_equal(ascending.raster, descending.raster[::-1])
+    np.testing.assert_array_equal(
+        ascending.mask(["DEU"]), descending.mask(["DEU"])[::-1]
+    )
+
+
+def test_admin_index_raster(countries, grid):
+    index = AdminIndex.build(countries, grid.lat.values, grid.lon.values)
+    raster = index.to_dataarray()
+
+    deu = index.mask(["DEU"], all_touched=False)
+    assert deu.sum() > 0
+    assert (deu <= index.mask(["DEU"])).all()
+    assert raster.dtype == np.int16
+    # cell centre in berlin
+    berlin = raster.sel(lat=52.5, lon=13.4, method="nearest").item()
+    assert index.codes[berlin - 1] == "DEU"
+    assert index.mask(["XXX"]).sum() == 0
+
+
+def test_open_admin_index_cached(countries, grid, tmp_path):
+    index = open_admin_index(countries, grid, cache_dir=tmp_path)
+    assert len(list(tmp_path.glob("admin_index_*.npz"))) == 1
+
+    cached = open_admin_index(countries, grid, cache_dir=tmp_path)
+    np.testing.assert_array_equal(index.cells, cached.cells)
+    np.testing.assert_array_equal(index.raster, cached.raster)
+    assert list(index.codes) == list(cached.codes)
+
+    # windows of the grid are sliced from the same index
+    window = grid.isel(lat=slice(3, 9), lon=slice(2, 7))
+    sliced = open_admin_index(countries, window, cache_dir=tmp_path)
+    built = AdminIndex.build(countries, window.lat.values, window.lon.values)
+    assert len(list(tmp_path.glob("admin_index_*.npz"))) == 1
+    np.testing.assert_array_equal(sliced.raster, built.raster)
+    for codes in [["DEU"], ["AUT", "CHE"], ["XXX"]]:
+        np.testing.assert_array_equal(sliced.mask(codes), built.mask(codes))
+
+    # a different grid gets its own index
+    open_admin_index(countries, grid.coarsen(lat=2, lon=2).mean(), cache_dir=tmp_path)
+    assert len(list(tmp_path.glob("admin_index_*.npz"))) == 2
+
+
+def test_dissolve_regions(countries):
+    regions = dissolve_regions(countries, {"benelux": ["BEL", "NLD", "LUX"]})
+    expected = countries[countries.ADM0_A3.isin(["BEL", "NLD", "LUX"])].dissolve()
+    assert regions.name.tolist() == ["benelux"]
+    assert regions.geometry.iloc[0].equals(expected.geometry.iloc[0])
+
+
+def test_region_geometries_cached(countries, tmp_path):
+    groups = {"benelux": ["BEL", "NLD", "LUX"], "dach": ["DEU", "AUT", "CHE"]}
+    regions = RegionGeometries(countries, groups, cache_dir=tmp_path)
+    assert len(list(tmp_path.glob("regions_*.parquet"))) == 0
+
+    full = regions.get("dach")
+    simplified = regions.get("dach", simplified=True)
+    assert len(list(tmp_path.glob("regions_*.parquet"))) == 2
+    assert len(full) == len(simplified) == 1
+    assert shapely.get_num_coordinates(
+        simplified.geometry.iloc[0]
+    ) < shapely.get_num_coordinates(full.geometry.iloc[0])
+    assert simplified.geometry.iloc[0].is_valid
+
+    # loaded once per name and variant
+    assert regions.get("dach") is full
+    with pytest.raises(KeyError):
+        regions.get("nordics")
+
+    # a new instance reuses the persisted files
+    other = RegionGeometries(countries, groups, cache_dir=tmp_path)
+    assert other.paths == regions.paths
+    assert other.get("benelux").geometry.iloc[0].equals(
+        dissolve_regions(countries, groups).geometry.iloc[0]
+    )
+
+
+def test_read_admin_cached(tmp_path):
+    path = os.path.join(
+        os.path.dirname(__file__), "../data/central_europe_countries.zip"
+    )
+    source = GeoPandasFileSource(path, use_fsspec=True)
+
+    df = read_admin(source, cache_dir=tmp_path)
+    assert list(df.columns) == ADMIN_COLUMNS
+    assert df.crs == "EPSG:4326"
+    assert len(list(tmp_path.glob("central_europe_countries_*.parquet"))) == 1
+
+    # served from the cache (no second read of the source)
+    source.read = None
+    cached = read_admin(source, cache_dir=tmp_path, columns=["ADM0_A3", "geometry"])
+    assert cached.ADM0_A3.tolist() == df.ADM0_A3.tolist()
+    assert cached.geometry.equals(df.geometry)
+
+    # derived caches are keyed by the source checksum (not the geometries)
+    lat, lon = np.arange(45.25, 50, 0.5), np.arange(5.25, 10, 0.5)
+    key = admin_digest(prepare_df_countries(df), lat, lon)
+    assert key == admin_digest(cached, lat, lon)
+    cached.attrs["checksum"] = "other"
+    assert key != admin_digest(cached, lat, lon)
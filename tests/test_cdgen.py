@@ -0,0 +1,460 @@
+import gzip
+import io
+import json
+from types import SimpleNamespace
+
+import dask
+import dask.array as da
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from dask.distributed import Client, LocalCluster
+
+from ldndctools.cdgen import (
+    available_cores,
+    block_shape,
+    block_sites,
+    block_tasks,
+    chunk_mask,
+    ClimateSiteStats,
+    compress_threads,
+    conf,
+    DATA_COLUMNS,
+    DATA_FORMAT,
+    fill_header,
+    fill_header_global,
+    geohash_xr,
+    main,
+    main_mirror,
+    manifest,
+    merge_chunks,
+    open_climate_source,
+    partition_bytes,
+    prefix_chunks,
+    prefix_length,
+    read_site,
+    site_bytes,
+    SiteStatsTable,
+    skip_empty_chunks,
+    snap_chunks,
+    subset_climate_data,
+    writer,
+)
+from ldndctools.io.blockarchive import open_index
+from ldndctools.misc.geohash import coords2geohash_dec
+
+
+@pytest.fixture
+def climate():
+    rng = np.random.default_rng(0)
+    time = pd.date_range("2000-11-01", "2002-02-28", freq="D")
+    shape = (len(time), 3, 4)
+    ds = xr.Dataset(
+        {c: (("time", "lat", "lon"), rng.normal(10, 5, shape)) for c in DATA_COLUMNS},
+        coords={"time": time, "lat": 50 + np.arange(3) * 0.1, "lon": np.arange(4.0)},
+    )
+    ds = ds.where((ds.lat > 50) | (ds.lon < 3))  # no data (ocean)
+    ds.loc[{"time": slice("2001-02-01", "2001-02-10")}] = np.nan  # gap
+    ds["prec"][:5] = 1.0  # prec alone is no data row
+    geohash = np.array([[-1, 31, 12, 54], [23, 42, 11, 5], [7, 8, 9, 10]])
+    return ds, geohash
+
+
+def writer_args(outfolder, **kwargs):
+    options = dict(compression="gzip", level=None, compress_threads=1)
+    return SimpleNamespace(outfolder=outfolder, **{**options, **kwargs})
+
+
+def reference_rows(ds, geohash):
+    """sorted site rows the old dataframe pipeline produced"""
+    df = ds.assign(geohash=(("lat", "lon"), geohash)).to_dataframe().reset_index()
+    df = df[df.geohash > 0].dropna(
+        subset=[c for c in DATA_COLUMNS if c != "prec"], how="all"
+    )
+    rows = {}
+    for site, gdf in df.groupby("geohash"):
+        gdf = gdf.sort_values(by="time")
+        values = [gdf.time.dt.year, gdf.time.dt.dayofyear]
+        rows[site] = np.column_stack(values + [gdf[c] for c in DATA_COLUMNS])
+    return rows
+
+
+def test_block_sites(climate):
+    ds, geohash = climate
+    data = {c: ds[c].values for c in DATA_COLUMNS}
+    sites, stats = block_sites(
+        data, ds.time.values, ds.lat.values, ds.lon.values, geohash
+    )
+
+    expected = reference_rows(ds, geohash)
+    assert sites.ids.tolist() == sorted(expected) == stats.geohash.tolist()
+    assert 12 in stats and 54 not in stats  # no data
+    for site, rows in sites:
+        np.testing.assert_array_equal(rows, expected[site])
+    assert sites.first_date == ds.time[0].dt.date.item()
+
+    years = ds.groupby("time.year")
+    site = stats[42]
+    cell = {"lat": 50.1, "lon": 1.0}
+    assert (site.latitude, site.longitude) == pytest.approx((50.1, 1.0))
+    assert site.temperature_average == pytest.approx(
+        years.mean().tavg.mean("year").sel(cell).item()
+    )
+    tavg = ds.tavg.groupby("time.year")
+    assert site.temperature_amplitude == pytest.approx(
+        ((tavg.max() - tavg.min()) / 2).mean("year").sel(cell).item()
+    )
+    assert site.annual_precipitation == pytest.approx(
+        years.sum().prec.mean("year").sel(cell).item()
+    )
+
+
+def test_writer(climate, tmp_path):
+    ds, geohash = climate
+    data = {c: ds[c].values for c in DATA_COLUMNS}
+    sites, stats = block_sites(
+        data, ds.time.values, ds.lat.values, ds.lon.values, geohash
+    )
+    args = writer_args(tmp_path)
+    assert writer(sites, 4, lookup=stats, args=args) == sites.ids.tolist()
+
+    with gzip.open(tmp_path / "climdata-004.txt.gz", "rt") as f:
+        text = f.read()
+
+    expected = io.StringIO()
+    expected.write(fill_header_global(sites.first_date))
+    for site, rows in reference_rows(ds, geohash).items():
+        expected.write(fill_header(stats[site]))
+        np.savetxt(expected, rows, fmt=DATA_FORMAT)
+        expected.write("\n\n")
+    assert text == expected.getvalue()
+
+    # random access to the sites of the archive
+    index = open_index(tmp_path)
+    assert sorted(index) == sorted(str(site) for site in sites.ids)
+    for site in [42, 11]:
+        block = read_site(index, site)
+        assert block.startswith(fill_header(stats[site]))
+        assert block in text
+
+
+def test_writer_threads(climate, tmp_path):
+    ds, geohash = climate
+    data = {c: ds[c].values for c in DATA_COLUMNS}
+    sites, stats = block_sites(
+        data, ds.time.values, ds.lat.values, ds.lon.values, geohash
+    )
+    for folder, threads in [("a", 1), ("b", 3)]:
+        (tmp_path / folder).mkdir()
+        args = writer_args(tmp_path / folder, compress_threads=threads, level=1)
+        writer(sites, 0, lookup=stats, args=args)
+
+    for name in ["climdata-000.txt.gz", "climdata-000.txt.gz.idx"]:
+        a, b = (tmp_path / folder / name for folder in "ab")
+        assert a.read_bytes() == b.read_bytes()
+
+
+def test_compress_threads():
+    # cores as seen by the workers, shared by all worker threads of a host
+    workers = {f"w{n}": {"host": "a", "nthreads": 1} for n in range(8)}
+    cores = {address: 8 for address in workers}
+    client = SimpleNamespace(
+        scheduler_info=lambda: {"workers": workers}, run=lambda func: cores
+    )
+    assert compress_threads(client) == 1
+    workers.update({"b1": {"host": "b", "nthreads": 2}})
+    cores["b1"] = 16
+    assert compress_threads(client) == 1
+    for n in range(6):
+        del workers[f"w{n}"]
+    assert compress_threads(client) == 4
+    assert compress_threads(SimpleNamespace(scheduler_info=lambda: {})) == 1
+
+    cluster = LocalCluster(n_workers=1, threads_per_worker=2, processes=False)
+    with cluster, Client(cluster) as client:
+        assert compress_threads(client) == max(available_cores() // 2, 1)
+
+
+def test_block_tasks(climate, tmp_path):
+    ds, geohash = climate
+    ds = ds.chunk({"time": 100, "lat": 2, "lon": 3})
+    args = writer_args(tmp_path)
+
+    tasks = block_tasks(ds, geohash, args)
+    assert len(tasks) == 4
+    with dask.config.set(scheduler="sync"):
+        written = dask.compute(*tasks)
+
+    assert len(list(tmp_path.glob("climdata-*.txt.gz"))) == 4
+    assert written[0] == [11, 12, 23, 31, 42]
+    assert sorted(sum(written, [])) == sorted(reference_rows(ds, geohash))
+
+
+def test_block_tasks_skip_blocks_without_sites(climate, tmp_path):
+    ds, geohash = climate
+    ds = ds.chunk({"time": 100, "lat": 2, "lon": 2})
+    geohash = np.where(np.arange(4) < 2, -1, geohash)  # west half masked out
+
+    tasks = block_tasks(ds, geohash, writer_args(tmp_path))
+    assert len(tasks) == 2
+    with dask.config.set(scheduler="sync"):
+        assert dask.compute(*tasks) == ([5, 11, 12], [9, 10])
+
+
+class Reads:
+    """array that records the (lat, lon) start of every read"""
+
+    def __init__(self, values):
+        self.values, self.starts = values, set()
+        self.shape, self.dtype, self.ndim = values.shape, values.dtype, values.ndim
+
+    def __getitem__(self, key):
+        self.starts.add((key[1].start, key[2].start))
+        return self.values[key]
+
+
+def test_chunk_mask():
+    valid = np.zeros((5, 7), dtype=bool)
+    valid[0, 0] = valid[4, 6] = True
+    used = chunk_mask(valid, ((2, 2, 1), (3, 4)))
+    np.testing.assert_array_equal(used, [[1, 0], [0, 0], [0, 1]])
+
+
+def test_skip_empty_chunks(climate):
+    ds, _ = climate
+    source = Reads(ds.tavg.values)
+    ds = ds.assign(tavg=ds.tavg.copy(data=da.from_array(source, chunks=(100, 2, 2))))
+    valid = np.zeros((3, 4), dtype=bool)
+    valid[0, 1] = valid[2, 3] = True
+
+    skipped = skip_empty_chunks(ds, valid)
+    assert skipped.tavg.chunks == ds.tavg.chunks
+    values = skipped.tavg.values
+    assert source.starts == {(0, 0), (2, 2)}
+    assert np.isnan(values[:, :2, 2:]).all() and np.isnan(values[:, 2:, :2]).all()
+    np.testing.assert_array_equal(values[:, :2, :2], source.values[:, :2, :2])
+
+
+def test_site_stats_table():
+    table = SiteStatsTable(
+        geohash=np.array([2, 4, 9]),
+        lat=np.array([50.0, 50.1, 50.2]),
+        lon=np.array([8.0, 8.1, 8.2]),
+        wind=np.ones(3),
+        prec=np.full(3, 800.0),
+        tavg=np.full(3, 9.0),
+        tamp=np.full(3, 8.0),
+    )
+    assert len(table) == 3
+    assert 4 in table and 5 not in table
+    assert table[4] == ClimateSiteStats(4, 50.1, 8.1, 1.0, 800.0, 9.0, 8.0)
+    with pytest.raises(KeyError):
+        table[10]
+
+
+def test_block_shape(climate):
+    ds, _ = climate
+    ds = ds.chunk({"time": 100, "lat": 1, "lon": 2})
+    per_site = site_bytes(ds)
+    assert per_site == ds.sizes["time"] * 7 * 8
+
+    assert block_shape(ds, 4 * per_site) == (1, 4)
+    assert block_shape(ds, 9 * per_site) == (2, 4)
+    assert block_shape(ds, 1000 * per_site) == (3, 4)
+    # a source chunk larger than the target is split
+    assert block_shape(ds.chunk({"lat": 3, "lon": 4}), 2 * per_site) == (1, 2)
+    assert block_shape(ds, 1) == (1, 1)
+
+
+def test_partition_bytes(climate):
+    ds, _ = climate
+    total = 12 * site_bytes(ds)
+
+    args = SimpleNamespace(npart=None, partition_size="1MB")
+    assert partition_bytes(ds, args) == 1_000_000
+    assert partition_bytes(ds, args, memory=2_000_000) == 200_000
+    args.npart = 4
+    assert partition_bytes(ds, args) == total // 4
+
+
+def test_merge_chunks():
+    assert merge_chunks((1, 3, 3, 1), 4) == (4, 4)
+    assert merge_chunks((1, 3, 3, 1), 3) == (1, 3, 3, 1)
+    assert merge_chunks((2, 10, 2), 4) == (2, 4, 4, 4)
+    assert merge_chunks((5,), 10) == (5,)
+
+
+def test_prefix_chunks():
+    lat, lon = 47 + np.arange(40) * 0.1, 10 + np.arange(30) * 0.1
+    grid = xr.DataArray(np.ones((40, 30)), coords={"lat": lat, "lon": lon})
+    geohash = geohash_xr(grid).values
+    geohash[:3], geohash[:, -2:] = -1, -1
+
+    # geohash cell bounds 47.8125, 49.21875, 50.625 (lat), 11.25, 12.65625 (lon)
+    ychunks, xchunks = prefix_chunks(geohash, 3)
+    assert (ychunks, xchunks) == ((9, 14, 14, 3), (13, 14, 3))
+    ybounds, xbounds = np.cumsum((0,) + ychunks), np.cumsum((0,) + xchunks)
+    for y0, y1 in zip(ybounds[:-1], ybounds[1:]):
+        for x0, x1 in zip(xbounds[:-1], xbounds[1:]):
+            block = geohash[y0:y1, x0:x1]
+            assert len(np.unique(block[block > 0] >> 15)) == 1  # one prefix
+
+    assert prefix_chunks(geohash, 1) == ((40,), (30,))
+
+    # blocks on the boundaries of source chunks (of 5 x 5, 20 split)
+    assert snap_chunks(ychunks, (5,) * 8) == (10, 15, 10, 5)
+    assert snap_chunks(xchunks, (5, 20, 5)) == (13, 12, 5)
+    assert prefix_length(geohash, 14 * 14) == 3
+    assert prefix_length(geohash, 1200) == 1
+
+
+def test_manifest():
+    site = coords2geohash_dec(lat=48.1, lon=11.6)
+    sites = [[site, coords2geohash_dec(lat=48.2, lon=11.7)], []]
+    entries = manifest(sites)["partitions"]
+    assert entries[0]["file"] == "climdata-000.txt.gz"
+    assert (entries[0]["prefix"], entries[0]["sites"]) == ("u28", 2)
+    # extent of the sites (not of the prefix)
+    x1, y1, x2, y2 = entries[0]["bbox"]
+    assert 11.59 < x1 < 11.6 and 11.7 < x2 < 11.71
+    assert 48.09 < y1 < 48.1 and 48.2 < y2 < 48.21
+    assert entries[0]["index"] == "climdata-000.txt.gz.idx"
+    assert entries[1]["sites"] == 0 and "prefix" not in entries[1]
+
+    # sites without a common prefix (partition of whole source chunks)
+    sites = [[site, coords2geohash_dec(lat=-10.0, lon=11.7)]]
+    (entry,) = manifest(sites)["partitions"]
+    assert entry["prefix"] == "" and entry["bbox"][1] < -9.9 < 48.1 < entry["bbox"][3]
+    assert 11.5 < entry["bbox"][0] and entry["bbox"][2] < 11.8
+
+
+def test_conf_from_config_file(tmp_path, monkeypatch):
+    config = tmp_path / "ldndctools.conf"
+    config.write_text("cdgen:\n    workers: 8\n    memory_limit: 3GB\n")
+
+    argv = ["cdgen", str(tmp_path / "out"), "-c", str(config)]
+    monkeypatch.setattr("sys.argv", argv)
+    args = conf()
+    assert (args.workers, args.memory_limit, args.threads) == (8, "3GB", False)
+
+    monkeypatch.setattr("sys.argv", argv + ["-w", "2"])
+    assert conf().workers == 2
+
+
+@pytest.fixture
+def climate_files(climate, tmp_path):
+    ds, _ = climate
+    ds = ds.assign_coords(lon=8 + ds.lon * 0.1).astype(np.float32)
+    ds.to_netcdf(tmp_path / "climate.nc")
+    ds.chunk({"time": 100, "lat": 2, "lon": 2}).to_zarr(tmp_path / "climate.zarr")
+    return ds, tmp_path
+
+
+def test_open_climate_source(climate_files):
+    ds, folder = climate_files
+    for name in ["climate.nc", "climate.zarr", "clim*.nc"]:
+        opened = open_climate_source(str(folder / name))
+        assert opened.tavg.chunks is not None
+        xr.testing.assert_identical(opened.load(), ds)
+
+    with pytest.raises(ValueError):
+        open_climate_source(str(folder / "missing"))
+
+
+def test_open_mirror_without_zarr_suffix(climate_files):
+    ds, folder = climate_files
+    store = folder / "region"
+    main_mirror([str(store), "--source", str(folder / "climate.nc")])
+    xr.testing.assert_identical(open_climate_source(str(store)).load(), ds)
+
+
+def test_subset_with_mask(climate_files):
+    ds, folder = climate_files
+    mask = xr.zeros_like(ds.tavg[0].drop_vars("time"))
+    mask[1, 1] = mask[2, 3] = 1
+
+    subset = subset_climate_data(source=str(folder / "climate.zarr"), mask=mask)
+    # cropped to the masked-in extent
+    assert dict(subset.sizes) == {"time": ds.sizes["time"], "lat": 2, "lon": 3}
+    window = {"lat": slice(1, 3), "lon": slice(1, 4)}
+    expected = ds.where(mask > 0).isel(window).assign_coords(mask=mask.isel(window))
+    xr.testing.assert_identical(subset.load(), expected)
+
+    # mask on a slightly shifted grid: exact values, no interpolation
+    shifted = mask.assign_coords(lat=mask.lat + 1e-6, lon=mask.lon - 1e-6)
+    subset = subset_climate_data(source=str(folder / "climate.zarr"), mask=shifted)
+    np.testing.assert_array_equal(subset["mask"], mask.isel(window))
+
+    with pytest.raises(ValueError):
+        subset_climate_data(
+            source=str(folder / "climate.zarr"), mask=shifted, mask_tolerance=1e-9
+        )
+
+
+def test_masked_run(climate_files, monkeypatch, capsys):
+    ds, folder = climate_files
+    mask = xr.ones_like(ds.tavg[0].drop_vars("time"))
+    mask = mask.where((mask.lat > 50.05) & (mask.lon < 8.25)).rename("rice")
+    mask.to_netcdf(folder / "mask.nc")
+
+    client = SimpleNamespace(scheduler_info=lambda: {})
+    monkeypatch.setattr("ldndctools.cdgen.start_client", lambda args: client)
+    argv = ["cdgen", str(folder / "out"), "-s", str(folder / "climate.zarr")]
+    monkeypatch.setattr("sys.argv", argv + ["-m", f"{folder / 'mask.nc'}:rice"])
+    main()
+    ids = (folder / "out" / "ids.txt").read_text().split()
+    assert len(ids) == 6  # masked-in cells (2 x 3)
+
+    # no masked-in cell within the bounding box: message instead of traceback
+    argv += ["-m", f"{folder / 'mask.nc'}:rice", "-b", "8.25,50.0,8.35,50.25"]
+    monkeypatch.setattr("sys.argv", argv)
+    with pytest.raises(SystemExit):
+        main()
+    assert "No mask cell matches" in capsys.readouterr().out
+
+
+def test_mirror_and_local_run(climate_files, monkeypatch):
+    ds, folder = climate_files
+    store = folder / "mirror.zarr"
+    subset = ["-b", "8.05,50.0,8.3,50.15", "--dmin", "2001-01-01"]
+    main_mirror([str(store), "--source", str(folder / "climate.zarr")] + subset)
+
+    mirrored = xr.open_zarr(store)
+    assert dict(mirrored.sizes) == {"time": 424, "lat": 2, "lon": 3}
+    xr.testing.assert_identical(
+        mirrored.load(),
+        ds.sel(lat=slice(50.0, 50.15), lon=slice(8.05, 8.3), time=slice("2001", None)),
+    )
+
+    # offline run on the local mirror (default scheduler instead of a cluster)
+    client = SimpleNamespace(scheduler_info=lambda: {})
+    monkeypatch.setattr("ldndctools.cdgen.start_client", lambda args: client)
+    monkeypatch.setattr(
+        "sys.argv", ["cdgen", str(folder / "out"), "--source", str(store)]
+    )
+    main()
+    ids = (folder / "out" / "ids.txt").read_text().split()
+    assert len(ids) == 5  # 6 cells, one without data
+
+    partitions = json.loads((folder / "out" / "manifest.json").read_text())
+    partitions = partitions["partitions"]
+    assert sum(p["sites"] for p in partitions) == 5
+    for p in partitions:
+        assert (folder / "out" / p["file"]).is_file()
+
+
+def test_time_major_mirror_run(climate_files, monkeypatch):
+    ds, folder = climate_files
+    store = folder / "tiles.zarr"
+    main_mirror([str(store), "--source", str(folder / "climate.nc"), "--time-major"])
+    assert xr.open_zarr(store).tavg.encoding["chunks"] == (ds.sizes["time"], 3, 4)
+
+    client = SimpleNamespace(scheduler_info=lambda: {})
+    monkeypatch.setattr("ldndctools.cdgen.start_client", lambda args: client)
+    monkeypatch.setattr(
+        "sys.argv", ["cdgen", str(folder / "out"), "--source", str(store)]
+    )
+    main()
+    ids = (folder / "out" / "ids.txt").read_text().split()
+    assert len(ids) == 11
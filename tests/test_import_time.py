@@ -0,0 +1,49 @@
+import subprocess
+import sys
+from typing import Dict
+
+import pytest
+
+# generous budget (s) for importing the cli modules (data stack takes > 2s)
+IMPORT_BUDGET = 1.5
+
+HEAVY_MODULES = [
+    "boto3",
+    "dask.distributed",
+    "geopandas",
+    "netCDF4",
+    "rasterio",
+    "rioxarray",
+]
+
+
+def import_times(module: str) -> Dict[str, float]:
+    """cumulative import time (s) of all modules imported by module"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative) * 1e-6
+    return times
+
+
+@pytest.mark.parametrize(
+    "module",
+    ["ldndctools.dlsc", "ldndctools.cdgen", "ldndctools.nlcc_split4db"],
+)
+def test_cli_import_is_light(module):
+    times = import_times(module)
+    assert times[module] < IMPORT_BUDGET
+    assert not set(HEAVY_MODULES) & set(times)
+
+
+def test_create_data_import_is_light():
+    times = import_times("ldndctools.misc.create_data")
+    assert not set(HEAVY_MODULES + ["xarray", "questionary"]) & set(times)